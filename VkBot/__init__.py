@@ -1,6 +1,14 @@
 __author__ = 'kranonetka'
 __author_id__ = 227725150
 
+from ._events import EventHandler, get_peer_id
+from ._http import ApiUrlAdapter, VkHttpAdapter
+from ._long_poll import LongPollRunner
+from ._metrics import metrics
+from ._revision import RevisionReader
+from ._schedule import DutySchedule
+from ._ticker import Ticker
 from .bot import Bot
+from .db import GroupIdCache
 from .parser import MessageParser
 from .parser.commands import PrivilegedCommand
@@ -0,0 +1,178 @@
+__author__ = 'kranonetka'
+
+import threading
+from contextlib import contextmanager
+
+from vk_api.exceptions import ApiError
+from vk_api.utils import sjson_dumps
+
+from ._metrics import VK_API_SECONDS, VK_API_ERRORS
+
+if False:  # Type hinting
+    from vk_api import VkApi  # noqa
+    from typing import Any, List, Optional  # noqa
+
+EXECUTE_MAX_CALLS = 25  # VK limit of API calls inside one `execute`
+
+
+class ApiCall:
+    """
+    Result of API call queued by `ApiCallBatcher`, resolved when its batch is sent
+    """
+
+    __slots__ = ('method', 'values', '_batcher', '_done', '_result', '_error', '_observed')
+
+    def __init__(self, batcher, method, values):
+        """
+        :type batcher: ApiCallBatcher
+        :type method: str
+        :type values: dict
+        """
+        self.method = method
+        self.values = values
+        self._batcher = batcher
+        self._done = False
+        self._result = None
+        self._error = None  # type: Optional[Exception]
+        self._observed = False  # `result()` was called
+
+    @property
+    def done(self):  # type: () -> bool
+        return self._done
+
+    @property
+    def error(self):  # type: () -> Optional[Exception]
+        return self._error
+
+    @property
+    def observed(self):  # type: () -> bool
+        return self._observed
+
+    def result(self):  # type: () -> Any
+        if not self._done:
+            self._batcher.flush()
+        self._observed = True
+        if self._error is not None:
+            raise self._error
+        return self._result
+
+    def set_result(self, result):  # type: (Any) -> None
+        self._result = result
+        self._done = True
+
+    def set_error(self, error):  # type: (Exception) -> None
+        self._error = error
+        self._done = True
+
+
+class ApiCallBatcher:
+    """
+    Sits in front of `VkApi.method`. Inside `batch()` calls are queued per thread and sent
+    by packs of up to 25 through a single `execute` request; outside of it calls go directly.
+    Errors of queued calls are raised by `ApiCall.result()`; the first error nobody read this way
+    is raised when the outermost `batch()` block exits.
+    """
+
+    def __init__(self, session, max_calls=EXECUTE_MAX_CALLS):
+        """
+        :type session: VkApi
+        :type max_calls: int
+        """
+        self._session = session
+        self._max_calls = max_calls
+        self._local = threading.local()
+
+    @contextmanager
+    def batch(self):
+        """
+        Queue calls made inside the block, flush them on exit. Nested blocks join the outer one.
+        Error of the block itself is not masked by errors of its calls
+        """
+        local = self._local
+        if getattr(local, 'depth', 0) == 0:
+            local.queue = []  # type: List[ApiCall]
+            local.failed = []  # type: List[ApiCall]
+        local.depth = getattr(local, 'depth', 0) + 1
+        try:
+            yield self
+        finally:
+            local.depth -= 1
+            if local.depth == 0:
+                self.flush()
+                failed, local.failed = local.failed, []
+        if local.depth == 0:
+            for api_call in failed:
+                if not api_call.observed:
+                    raise api_call.error
+
+    def call(self, method, values=None):  # type: (str, Optional[dict]) -> ApiCall
+        api_call = ApiCall(self, method, dict(values or {}))
+
+        if getattr(self._local, 'depth', 0) == 0:
+            self._send([api_call])
+            api_call.result()  # Raise error immediately, as plain `VkApi.method` does
+        else:
+            queue = self._local.queue
+            queue.append(api_call)
+            if len(queue) >= self._max_calls:
+                self.flush()
+        return api_call
+
+    def method(self, method, values=None):  # type: (str, Optional[dict]) -> Any
+        """
+        Drop-in replacement for `VkApi.method`: sends queued calls and waits for the result
+        """
+        return self.call(method, values).result()
+
+    def flush(self):  # type: () -> None
+        queue = getattr(self._local, 'queue', None)
+        if queue:
+            self._local.queue = []
+            for start in range(0, len(queue), self._max_calls):
+                self._send(queue[start:start + self._max_calls])
+            self._local.failed.extend(api_call for api_call in queue if api_call.error is not None)
+
+    def _send(self, calls):  # type: (List[ApiCall]) -> None
+        if len(calls) == 1:
+            api_call, = calls
+            try:
+                with VK_API_SECONDS.time(api_call.method):
+                    api_call.set_result(self._session.method(api_call.method, api_call.values))
+            except Exception as e:
+                VK_API_ERRORS.inc(api_call.method, _error_label(e))
+                api_call.set_error(e)
+            return
+
+        try:
+            with VK_API_SECONDS.time('execute'):
+                response = self._session.method('execute', {'code': self._build_code(calls)}, raw=True)
+        except Exception as e:
+            VK_API_ERRORS.inc('execute', _error_label(e))
+            for api_call in calls:
+                api_call.set_error(e)
+            return
+
+        errors = iter(response.get('execute_errors', ()))
+        for api_call, result in zip(calls, response['response']):
+            if result is False:
+                error = next(errors, {'error_code': 0, 'error_msg': 'Unknown execute error'})
+                VK_API_ERRORS.inc(api_call.method, str(error['error_code']))
+                api_call.set_error(ApiError(self._session, api_call.method, api_call.values, False, error))
+            else:
+                api_call.set_result(result)
+
+    @staticmethod
+    def _build_code(calls):  # type: (List[ApiCall]) -> str
+        return 'return [{}];'.format(','.join(
+            f'API.{api_call.method}({sjson_dumps(api_call.values)})'
+            for api_call in calls
+        ))
+
+
+def _error_label(error):  # type: (Exception) -> str
+    """
+    VK error code for API errors, exception class name otherwise
+    """
+    if isinstance(error, ApiError):
+        return str(error.code)
+    return error.__class__.__name__
@@ -0,0 +1,62 @@
+__author__ = 'kranonetka'
+
+from ._metrics import COMMAND_SECONDS, COMMAND_ERRORS
+from .parser.commands import PrivilegedCommand
+
+if False:  # Type hinting
+    from typing import Callable, Optional  # noqa
+    from .bot import Bot  # noqa
+    from .parser import MessageParser  # noqa
+
+
+def get_peer_id(event):  # type: (dict) -> int
+    """
+    Peer of `message_new` event, 0 for other events
+    """
+    try:
+        return event['object']['message']['peer_id']
+    except (KeyError, TypeError):
+        return 0
+
+
+class EventHandler:
+    """
+    Handles one VK event, wherever it came from (Callback API or Bots Long Poll):
+    parses text of `message_new` and performs the command with bot of event's group
+    """
+
+    def __init__(self, get_bot, parser):
+        """
+        :param get_bot: Callable[[int], Optional[Bot]] -- bot by group id, None if group is not served
+        :type parser: MessageParser
+        """
+        self._get_bot = get_bot
+        self._parser = parser
+
+    def __call__(self, event):  # type: (dict) -> None
+        vk_bot = self._get_bot(event['group_id'])
+        if vk_bot is None:
+            return
+
+        if event['type'] == 'message_new':
+            message_obj = event['object']['message']
+
+            message = self._parser.try_parse(message_obj['text'])
+            if message is None:
+                return
+
+            if message.mention:
+                if not vk_bot.is_mentioned(message.mention):
+                    return
+
+            if isinstance(message.command, PrivilegedCommand):
+                if not vk_bot.is_admin(message_obj['from_id']):
+                    return
+
+            command_name = str(message.command)
+            try:
+                with COMMAND_SECONDS.time(command_name), vk_bot.batch():
+                    message.command.perform(vk_bot, message_obj['peer_id'])
+            except Exception:
+                COMMAND_ERRORS.inc(command_name)
+                raise
@@ -0,0 +1,54 @@
+__author__ = 'kranonetka'
+
+from requests.adapters import HTTPAdapter
+
+if False:  # Type hinting
+    from requests import PreparedRequest, Response, Session  # noqa
+    from typing import Optional, Tuple, Union  # noqa
+
+VK_API_PREFIXES = ('https://api.vk.ru/method/', 'https://api.vk.com/method/')
+
+
+class VkHttpAdapter(HTTPAdapter):
+    """
+    Transport of VK API requests: keep-alive pool of `pool_size` connections and timeout for every request.
+    When all connections are busy, requests wait for a free one instead of opening throwaway connections
+    """
+
+    def __init__(self, timeout=10.0, pool_size=10, **kwargs):
+        """
+        :param timeout: Union[float, Tuple[float, float]] -- seconds to connect and to wait for response,
+            used when request has no own timeout
+        :type pool_size: int
+        """
+        kwargs.setdefault('pool_connections', 1)
+        kwargs.setdefault('pool_maxsize', pool_size)
+        kwargs.setdefault('pool_block', True)
+        super(VkHttpAdapter, self).__init__(**kwargs)
+        self._timeout = timeout
+
+    def send(self, request, timeout=None, **kwargs):  # type: (PreparedRequest, ..., ...) -> Response
+        return super(VkHttpAdapter, self).send(request, timeout=timeout or self._timeout, **kwargs)
+
+    @classmethod
+    def mount(cls, http_session, *args, **kwargs):  # type: (Session, ..., ...) -> None
+        adapter = cls(*args, **kwargs)
+        for prefix in VK_API_PREFIXES:
+            http_session.mount(prefix, adapter)
+
+
+class ApiUrlAdapter(VkHttpAdapter):
+    """
+    Redirects VK API requests to another base url, e.g. local fake VK endpoint
+    """
+
+    def __init__(self, api_url, **kwargs):  # type: (str, ...) -> None
+        super(ApiUrlAdapter, self).__init__(**kwargs)
+        self._api_url = api_url.rstrip('/') + '/'
+
+    def send(self, request, **kwargs):  # type: (PreparedRequest, ...) -> Response
+        for prefix in VK_API_PREFIXES:
+            if request.url.startswith(prefix):
+                request.url = self._api_url + request.url[len(prefix):]
+                break
+        return super(ApiUrlAdapter, self).send(request, **kwargs)
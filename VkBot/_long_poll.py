@@ -0,0 +1,150 @@
+__author__ = 'kranonetka'
+
+import asyncio
+import random
+import traceback
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from ._events import get_peer_id
+
+if False:  # Type hinting
+    from vk_api.bot_longpoll import VkBotLongPoll  # noqa
+    from typing import Callable, Deque, Dict, List, Optional, Set, Tuple  # noqa
+
+
+class LongPollRunner:
+    """
+    Bots Long Poll loop on asyncio. Events are fetched in batches by `VkBotLongPoll.check` and handled
+    by `handler` on a thread pool, at most `concurrency` at once; events of one peer are handled in order.
+    `ts` of the last batch whose events are all handled is saved, so restarted runner resumes from it.
+    Failed long poll requests are retried with growing delay, long poll server is requested anew before a retry.
+    """
+
+    def __init__(self, long_poll, handler, concurrency=4, max_pending=None, load_ts=None, save_ts=None,
+                 retry_delay=1.0, max_retry_delay=60.0):
+        """
+        :type long_poll: VkBotLongPoll
+        :param handler: Callable[[dict], None] -- same event handler as for Callback API
+        :type concurrency: int
+        :param max_pending: Optional[int] -- events fetched but not handled yet, after which
+            polling waits for handlers. 10 per thread by default
+        :param load_ts: Optional[Callable[[], Optional[str]]] -- `ts` saved by previous run
+        :param save_ts: Optional[Callable[[str], None]]
+        :param retry_delay: float -- seconds before the first retry of failed request, doubled for each next one
+        :param max_retry_delay: float
+        """
+        self._long_poll = long_poll
+        self._handler = handler
+        self._concurrency = concurrency
+        self._max_pending = max_pending or concurrency * 10
+        self._load_ts = load_ts
+        self._save_ts = save_ts
+        self._retry_delay = retry_delay
+        self._max_retry_delay = max_retry_delay
+
+        self._executor = None  # type: Optional[ThreadPoolExecutor]
+        self._semaphore = None  # type: Optional[asyncio.Semaphore]
+        self._pending = set()  # type: Set[asyncio.Task]
+        self._peer_tails = {}  # type: Dict[int, asyncio.Task]  # Last task of each peer
+        self._batches = deque()  # type: Deque[Tuple[str, List[asyncio.Task]]]  # (ts after batch, its tasks)
+        self._saved_ts = None  # type: Optional[str]
+        self._stopping = False
+        self._stopped = None  # type: Optional[asyncio.Event]  # Interrupts delay before retry
+        self.handled = 0
+
+    async def run(self):  # type: () -> None
+        """
+        Poll until `stop` is called, then finish handling of fetched events
+        """
+        loop = asyncio.get_running_loop()
+        self._semaphore = asyncio.Semaphore(self._concurrency)
+        self._stopping = False
+        self._stopped = asyncio.Event()
+        failures = 0
+
+        with ThreadPoolExecutor(self._concurrency, thread_name_prefix=self.__class__.__name__) as executor, \
+                ThreadPoolExecutor(1, thread_name_prefix=f'{self.__class__.__name__}-poll') as poll_executor:
+            self._executor = executor
+
+            if self._load_ts is not None:
+                self._saved_ts = await loop.run_in_executor(executor, self._load_ts)
+                if self._saved_ts is not None:
+                    self._long_poll.ts = self._saved_ts
+
+            try:
+                while not self._stopping:
+                    try:
+                        events = await loop.run_in_executor(poll_executor, self._poll, failures > 0)
+                    except Exception:  # noqa
+                        traceback.print_exc()  # Timeout, connection error, non-JSON answer of failing server
+                        await self._wait_retry(failures)
+                        failures += 1
+                        continue
+                    failures = 0
+                    tasks = [self._dispatch(event.raw) for event in events]
+                    self._batches.append((self._long_poll.ts, tasks))
+                    await self._save_handled_ts()
+
+                    while len(self._pending) >= self._max_pending:
+                        await asyncio.wait(self._pending, return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                if self._pending:
+                    await asyncio.wait(self._pending)
+                await self._save_handled_ts()
+
+    def stop(self):  # type: () -> None
+        """
+        Stop after current long poll request returns
+        """
+        self._stopping = True
+        if self._stopped is not None:
+            self._stopped.set()
+
+    def _poll(self, refresh_server):  # type: (bool) -> list
+        """
+        :param refresh_server: request long poll server and key first, previous request failed
+            and they may be stale. Current `ts` is kept
+        """
+        if refresh_server:
+            self._long_poll.update_longpoll_server(update_ts=False)
+        return self._long_poll.check()
+
+    async def _wait_retry(self, attempt):  # type: (int) -> None
+        delay = min(self._retry_delay * 2 ** attempt, self._max_retry_delay) * random.uniform(0.5, 1.5)
+        try:
+            await asyncio.wait_for(self._stopped.wait(), delay)
+        except asyncio.TimeoutError:
+            pass
+
+    def _dispatch(self, event):  # type: (dict) -> asyncio.Task
+        peer_id = get_peer_id(event)
+        task = asyncio.create_task(self._handle(event, self._peer_tails.get(peer_id)))
+        self._peer_tails[peer_id] = task
+        self._pending.add(task)
+        task.add_done_callback(lambda done: self._forget(peer_id, done))
+        return task
+
+    async def _handle(self, event, previous):  # type: (dict, Optional[asyncio.Task]) -> None
+        if previous is not None:
+            await asyncio.wait((previous,))
+        async with self._semaphore:
+            try:
+                await asyncio.get_running_loop().run_in_executor(self._executor, self._handler, event)
+            except Exception:  # noqa
+                traceback.print_exc()
+        self.handled += 1
+
+    def _forget(self, peer_id, task):  # type: (int, asyncio.Task) -> None
+        self._pending.discard(task)
+        if self._peer_tails.get(peer_id) is task:
+            del self._peer_tails[peer_id]
+
+    async def _save_handled_ts(self):  # type: () -> None
+        ts = None
+        while self._batches and all(task.done() for task in self._batches[0][1]):
+            ts, _ = self._batches.popleft()
+
+        if ts is not None and ts != self._saved_ts and self._save_ts is not None:
+            await asyncio.get_running_loop().run_in_executor(self._executor, self._save_ts, ts)
+            self._saved_ts = ts
@@ -0,0 +1,187 @@
+__author__ = 'kranonetka'
+
+import math
+import threading
+import time
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+from contextlib import nullcontext
+
+if False:  # Type hinting
+    from typing import Dict, List, Tuple, Sequence  # noqa
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_DISABLED_TIMER = nullcontext()
+
+
+class MetricsRegistry:
+    """
+    Counters and histograms rendered in Prometheus text exposition format.
+    Disabled by default: recording is then a single attribute check, nothing is stored
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self._metrics = []  # type: List[_Metric]
+
+    def enable(self):  # type: () -> None
+        self.enabled = True
+
+    def counter(self, name, documentation, label_names=()):  # type: (str, str, Sequence[str]) -> Counter
+        return self._register(Counter(self, name, documentation, label_names))
+
+    def histogram(self, name, documentation, label_names=(), buckets=DEFAULT_BUCKETS):
+        """
+        :type name: str
+        :type documentation: str
+        :type label_names: Sequence[str]
+        :param buckets: Sequence[float] -- upper bounds in seconds, ascending
+        :rtype: Histogram
+        """
+        return self._register(Histogram(self, name, documentation, label_names, buckets))
+
+    def render(self):  # type: () -> str
+        lines = []
+        for metric in self._metrics:
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.type}')
+            lines.extend(metric.samples())
+        return '\n'.join(lines) + '\n'
+
+    def _register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+
+class _Metric(ABC):
+    type = None  # type: str
+
+    def __init__(self, registry, name, documentation, label_names):
+        """
+        :type registry: MetricsRegistry
+        :type name: str
+        :type documentation: str
+        :type label_names: Sequence[str]
+        """
+        self._registry = registry
+        self.name = name
+        self.documentation = documentation
+        self._label_names = tuple(label_names)
+        self._lock = threading.Lock()
+
+    @abstractmethod
+    def samples(self):  # type: () -> List[str]
+        pass
+
+    def _labels(self, label_values, **extra):  # type: (tuple, str) -> str
+        pairs = list(zip(self._label_names, label_values)) + list(extra.items())
+        if not pairs:
+            return ''
+        return '{' + ','.join(f'{name}="{_escape(str(value))}"' for name, value in pairs) + '}'
+
+
+class Counter(_Metric):
+    type = 'counter'
+
+    def __init__(self, registry, name, documentation, label_names):
+        super(Counter, self).__init__(registry, name, documentation, label_names)
+        self._values = {}  # type: Dict[tuple, float]
+
+    def inc(self, *label_values, amount=1):
+        if not self._registry.enabled:
+            return
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def samples(self):  # type: () -> List[str]
+        with self._lock:
+            values = sorted(self._values.items())
+        return [f'{self.name}{self._labels(label_values)} {_format(value)}' for label_values, value in values]
+
+
+class Histogram(_Metric):
+    type = 'histogram'
+
+    def __init__(self, registry, name, documentation, label_names, buckets):
+        super(Histogram, self).__init__(registry, name, documentation, label_names)
+        self._buckets = tuple(buckets)
+        self._values = {}  # type: Dict[tuple, Tuple[List[int], List[float]]]  # labels -> (bucket counts, [sum])
+
+    def observe(self, value, *label_values):  # type: (float, str) -> None
+        if not self._registry.enabled:
+            return
+        idx = bisect_left(self._buckets, value)  # First bucket with upper bound >= value
+        with self._lock:
+            entry = self._values.get(label_values)
+            if entry is None:
+                entry = self._values[label_values] = ([0] * (len(self._buckets) + 1), [0.0])
+            counts, total = entry
+            counts[idx] += 1
+            total[0] += value
+
+    def time(self, *label_values):
+        """
+        Context manager observing seconds spent inside the block
+        """
+        if not self._registry.enabled:
+            return _DISABLED_TIMER
+        return _Timer(self, label_values)
+
+    def samples(self):  # type: () -> List[str]
+        with self._lock:
+            values = sorted((label_values, (list(counts), total[0]))
+                            for label_values, (counts, total) in self._values.items())
+
+        samples = []
+        for label_values, (counts, total) in values:
+            cumulative = 0
+            for bound, count in zip(self._buckets + (math.inf,), counts):
+                cumulative += count
+                le = '+Inf' if bound == math.inf else _format(bound)
+                samples.append(f'{self.name}_bucket{self._labels(label_values, le=le)} {cumulative}')
+            samples.append(f'{self.name}_sum{self._labels(label_values)} {_format(total)}')
+            samples.append(f'{self.name}_count{self._labels(label_values)} {cumulative}')
+        return samples
+
+
+class _Timer:
+    __slots__ = ('_histogram', '_label_values', '_start')
+
+    def __init__(self, histogram, label_values):  # type: (Histogram, tuple) -> None
+        self._histogram = histogram
+        self._label_values = label_values
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self._histogram.observe(time.perf_counter() - self._start, *self._label_values)
+        return False
+
+
+def _escape(value):  # type: (str) -> str
+    return value.replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+def _format(value):  # type: (float) -> str
+    return repr(float(value))
+
+
+metrics = MetricsRegistry()
+
+COMMAND_SECONDS = metrics.histogram(
+    'vkbot_command_seconds', 'Time spent in Command.perform', ('command',))
+COMMAND_ERRORS = metrics.counter(
+    'vkbot_command_errors_total', 'Commands whose perform raised', ('command',))
+PARSE_SECONDS = metrics.histogram(
+    'vkbot_parse_seconds', 'Time spent parsing messages by grammar, cached results excluded')
+PARSE_FAILURES = metrics.counter(
+    'vkbot_parse_failures_total', 'Messages not matching the grammar')
+DB_SECONDS = metrics.histogram(
+    'vkbot_db_seconds', 'Time DB sessions (kind="session") and read connections (kind="read") were held', ('kind',))
+VK_API_SECONDS = metrics.histogram(
+    'vkbot_vk_api_seconds', 'VK API request latency', ('method',))
+VK_API_ERRORS = metrics.counter(
+    'vkbot_vk_api_errors_total', 'Failed VK API calls, calls inside execute included', ('method', 'error'))
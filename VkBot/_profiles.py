@@ -0,0 +1,77 @@
+__author__ = 'kranonetka'
+
+import threading
+import time
+from collections import OrderedDict
+
+if False:  # Type hinting
+    from typing import Iterable, List, Dict, Optional  # noqa
+
+
+class UserProfileCache:
+    """
+    TTL and size bounded LRU cache of VK user profiles (`users.get` items).
+    Missing profiles are resolved by `fetch` with one `users.get` call for all of them.
+    """
+
+    def __init__(self, fetch, ttl, max_size):
+        """
+        :param fetch: Callable[[List[int]], List[dict]] -- `users.get` for given ids
+        :type ttl: float
+        :type max_size: int
+        """
+        self._fetch = fetch
+        self._ttl = ttl
+        self._max_size = max_size
+        self._lock = threading.Lock()
+        self._profiles = OrderedDict()  # type: OrderedDict[int, tuple]  # user_id -> (expiration time, profile)
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, user_id):  # type: (int) -> dict
+        return self.get_many((user_id,))[0]
+
+    def get_many(self, user_ids):  # type: (Iterable[int]) -> List[dict]
+        user_ids = list(user_ids)
+        profiles = self.prefetch(user_ids)
+        return [profiles[user_id] for user_id in user_ids]
+
+    def prefetch(self, user_ids):  # type: (Iterable[int]) -> Dict[int, dict]
+        """
+        Make sure profiles of all given users are cached, requesting uncached ones at once
+        """
+        now = time.monotonic()
+        found = {}
+        missing = []
+        with self._lock:
+            for user_id in dict.fromkeys(user_ids):
+                cached = self._profiles.get(user_id)
+                if cached is not None and cached[0] > now:
+                    self._profiles.move_to_end(user_id)
+                    found[user_id] = cached[1]
+                    self.hits += 1
+                else:
+                    missing.append(user_id)
+                    self.misses += 1
+
+        if missing:
+            fetched = self._fetch(missing)
+            with self._lock:
+                for profile in fetched:
+                    found[profile['id']] = profile
+                    self._profiles[profile['id']] = (now + self._ttl, profile)
+                    self._profiles.move_to_end(profile['id'])
+                while len(self._profiles) > self._max_size:
+                    self._profiles.popitem(last=False)
+        return found
+
+    def invalidate(self, user_id=None):  # type: (Optional[int]) -> None
+        with self._lock:
+            if user_id is None:
+                self._profiles.clear()
+            else:
+                self._profiles.pop(user_id, None)
+
+    @property
+    def stats(self):  # type: () -> dict
+        return dict(hits=self.hits, misses=self.misses, size=len(self._profiles))
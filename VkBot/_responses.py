@@ -0,0 +1,56 @@
+__author__ = 'kranonetka'
+
+import threading
+
+if False:  # Type hinting
+    import datetime  # noqa
+    from typing import Callable, Dict, Optional, Tuple  # noqa
+
+
+class ResponseCache:
+    """
+    Rendered replies of read-only commands by (renderer, its arguments, local date, state version).
+    Entries of a day are dropped when the first request of the next day comes, `invalidate` drops
+    all of them and bumps the version, so replies rendered from the old state are not stored.
+    Hit costs a dict lookup.
+    """
+
+    def __init__(self, max_size=1024):  # type: (int) -> None
+        """
+        :param max_size: entries kept for a day, replies over it are rendered every time
+        """
+        self._max_size = max_size
+        self._lock = threading.Lock()
+        self._version = 0
+        self._date = None  # type: Optional[datetime.date]
+        self._entries = {}  # type: Dict[tuple, str]  # Replaced, never cleared in place
+
+    @property
+    def version(self):  # type: () -> int
+        return self._version
+
+    def get(self, today, render, *args):  # type: (datetime.date, Callable[..., str], object) -> str
+        """
+        Reply of `render(*args)` for the day, rendered on the first request
+        """
+        version = self._version  # Read before the state `render` uses
+        key = (render, args, today, version)
+        response = self._entries.get(key)
+        if response is None:
+            response = render(*args)
+            with self._lock:
+                if self._date != today and (self._date is None or today > self._date):
+                    self._date = today
+                    self._entries = {}
+                entries = self._entries
+                if (version, today) == (self._version, self._date) and len(entries) < self._max_size:
+                    entries[key] = response
+        return response
+
+    def invalidate(self):  # type: () -> None
+        """
+        Called after every change of the state replies are rendered from
+        """
+        with self._lock:
+            self._version += 1
+            self._entries = {}
@@ -0,0 +1,35 @@
+__author__ = 'kranonetka'
+
+import threading
+
+import git
+
+if False:  # Type hinting
+    from typing import Optional, Tuple  # noqa
+
+
+class RevisionReader:
+    """
+    Hash and message of HEAD commit of the git repository bots run from. Several bots may share one reader:
+    it keeps one persistent `git cat-file` process, which is not thread-safe, so reads are serialized.
+    Message is read again only when HEAD moves.
+    """
+
+    def __init__(self, path='.'):  # type: (str) -> None
+        self._repo = git.Repo(path)
+        self._lock = threading.Lock()
+        self._head = None  # type: Optional[Tuple[str, str]]
+
+    def head(self):  # type: () -> Tuple[str, str]
+        """
+        (revision, stripped commit message)
+        """
+        with self._lock:
+            commit = self._repo.head.commit
+            if self._head is None or self._head[0] != commit.hexsha:
+                self._head = (commit.hexsha, commit.message.strip())
+            return self._head
+
+    def close(self):  # type: () -> None
+        with self._lock:
+            self._repo.close()
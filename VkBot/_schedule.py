@@ -0,0 +1,89 @@
+__author__ = 'kranonetka'
+
+import datetime
+
+if False:  # Type hinting
+    from typing import Tuple, Sequence, List, Dict  # noqa
+
+
+class DutySchedule:
+    """
+    Closed-form duty rotation: each side shifts by one room per day starting from the sync point,
+    so any date is answered by a single modular offset without walking the calendar.
+    """
+
+    __slots__ = ('_sync_date', '_left_rooms', '_right_rooms', '_left_index', '_right_index',
+                 '_left_base', '_right_base')
+
+    def __init__(self, sync_date, sync_left_room, sync_right_room, left_rooms, right_rooms):
+        """
+        :type sync_date: datetime.date
+        :type sync_left_room: int
+        :type sync_right_room: int
+        :type left_rooms: Sequence[int]
+        :type right_rooms: Sequence[int]
+        """
+        self._sync_date = sync_date
+        self._left_rooms = tuple(left_rooms)  # type: Tuple[int, ...]
+        self._right_rooms = tuple(right_rooms)  # type: Tuple[int, ...]
+        self._left_index = {room: idx for idx, room in enumerate(self._left_rooms)}  # type: Dict[int, int]
+        self._right_index = {room: idx for idx, room in enumerate(self._right_rooms)}  # type: Dict[int, int]
+        self._left_base = self._left_index[sync_left_room]
+        self._right_base = self._right_index[sync_right_room]
+
+    def rooms_for_date(self, dest_date):  # type: (datetime.date) -> Tuple[int, int]
+        offset = (dest_date - self._sync_date).days
+        return (
+            self._left_rooms[(self._left_base + offset) % len(self._left_rooms)],
+            self._right_rooms[(self._right_base + offset) % len(self._right_rooms)]
+        )
+
+    def rooms_for_range(self, start_date, days):
+        # type: (datetime.date, int) -> List[Tuple[datetime.date, int, int]]
+        """
+        Duty pair for each of `days` consecutive dates starting from `start_date`
+        """
+        left_rooms, right_rooms = self._left_rooms, self._right_rooms
+        left_count, right_count = len(left_rooms), len(right_rooms)
+
+        offset = (start_date - self._sync_date).days
+        left_start = self._left_base + offset
+        right_start = self._right_base + offset
+
+        return [
+            (
+                start_date + datetime.timedelta(days=day),
+                left_rooms[(left_start + day) % left_count],
+                right_rooms[(right_start + day) % right_count]
+            )
+            for day in range(days)
+        ]
+
+    def duty_date(self, room, today):  # type: (int, datetime.date) -> datetime.date
+        """
+        Nearest date (today included) when `room` is on duty
+        """
+        return today + datetime.timedelta(days=self._days_until(room, today))
+
+    def next_duty_dates(self, today, count):  # type: (datetime.date, int) -> Dict[int, List[datetime.date]]
+        """
+        Next `count` duty dates (today included) for every room
+        """
+        dates = {}
+        for rooms, index, base in ((self._left_rooms, self._left_index, self._left_base),
+                                   (self._right_rooms, self._right_index, self._right_base)):
+            period = len(rooms)
+            current = (base + (today - self._sync_date).days) % period
+            for room in rooms:
+                first = today + datetime.timedelta(days=(index[room] - current) % period)
+                dates[room] = [first + datetime.timedelta(days=period * turn) for turn in range(count)]
+        return dates
+
+    def _days_until(self, room, today):  # type: (int, datetime.date) -> int
+        if room in self._left_index:
+            index, base, period = self._left_index, self._left_base, len(self._left_rooms)
+        else:
+            index, base, period = self._right_index, self._right_base, len(self._right_rooms)
+
+        current = (base + (today - self._sync_date).days) % period
+        return (index[room] - current) % period
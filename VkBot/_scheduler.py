@@ -0,0 +1,75 @@
+__author__ = 'kranonetka'
+
+import datetime
+import threading
+import time
+import traceback
+
+if False:  # Type hinting
+    from typing import Callable, Optional  # noqa
+    from ._ticker import Ticker  # noqa
+
+
+class MidnightScheduler:
+    """
+    Calls `job` with the new date in background thread soon after every midnight of `clock`'s local time.
+    Sleeps are capped by `max_sleep`, so the thread notices clock adjustments and DST shifts.
+    Failed job is retried with the same date on wake-ups at least `retry_delay` later
+    until it succeeds or the date changes.
+    Midnight passed while the process was not running is not caught up.
+    With shared `ticker` no own thread is started, the date is checked on every tick instead.
+    """
+
+    def __init__(self, clock, job, max_sleep=600.0, retry_delay=60.0, ticker=None):
+        """
+        :param clock: Callable[[], datetime.datetime] -- current naive local time
+        :param job: Callable[[datetime.date], None]
+        :type max_sleep: float
+        :type retry_delay: float
+        :type ticker: Optional[Ticker]
+        """
+        self._clock = clock
+        self._job = job
+        self._max_sleep = max_sleep
+        self._retry_delay = retry_delay
+        self._ticker = ticker
+        self._last_date = clock().date()
+        self._retry_at = 0.0  # Monotonic time before which job of failed date is not retried
+        self._failed_date = None  # type: Optional[datetime.date]
+        self._stopped = threading.Event()
+
+        if ticker is not None:
+            ticker.add(self.tick)
+        else:
+            threading.Thread(target=self._run, name=self.__class__.__name__, daemon=True).start()
+
+    def tick(self):  # type: () -> None
+        """
+        Call `job` if the date changed since its last successful call
+        """
+        today = self._clock().date()
+        if today == self._last_date or today == self._failed_date and time.monotonic() < self._retry_at:
+            return
+        try:
+            self._job(today)
+        except Exception:  # noqa
+            self._failed_date, self._retry_at = today, time.monotonic() + self._retry_delay
+            raise
+        self._last_date = today
+
+    def stop(self):  # type: () -> None
+        self._stopped.set()
+        if self._ticker is not None:
+            self._ticker.discard(self.tick)
+
+    def _seconds_to_midnight(self):  # type: () -> float
+        now = self._clock()
+        midnight = datetime.datetime.combine(now.date() + datetime.timedelta(days=1), datetime.time.min)
+        return (midnight - now).total_seconds()
+
+    def _run(self):
+        while not self._stopped.wait(min(self._seconds_to_midnight() + 0.001, self._max_sleep)):
+            try:
+                self.tick()
+            except Exception:  # noqa
+                traceback.print_exc()
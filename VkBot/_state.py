@@ -0,0 +1,89 @@
+__author__ = 'kranonetka'
+
+from ._schedule import DutySchedule
+
+if False:  # Type hinting
+    import datetime  # noqa
+    from typing import Tuple, Sequence  # noqa
+
+
+class RotationState:
+    """
+    Immutable snapshot of the duty rotation: duty rooms split by side and the sync point.
+    Never mutated after construction, so it can be read from many threads at once;
+    changes produce a new snapshot via `replace`.
+    """
+
+    __slots__ = ('_left_rooms', '_right_rooms', '_rooms', '_room_set',
+                 '_sync_date', '_sync_left_room', '_sync_right_room', '_schedule')
+
+    def __init__(self, left_rooms, right_rooms, sync_date, sync_left_room, sync_right_room):
+        """
+        :type left_rooms: Sequence[int]
+        :type right_rooms: Sequence[int]
+        :type sync_date: datetime.date
+        :type sync_left_room: int
+        :type sync_right_room: int
+        """
+        self._left_rooms = tuple(left_rooms)  # type: Tuple[int, ...]
+        self._right_rooms = tuple(right_rooms)  # type: Tuple[int, ...]
+        self._rooms = tuple(sorted(self._left_rooms + self._right_rooms))  # type: Tuple[int, ...]
+        self._room_set = frozenset(self._rooms)
+        self._sync_date = sync_date
+        self._sync_left_room = sync_left_room
+        self._sync_right_room = sync_right_room
+        self._schedule = DutySchedule(sync_date, sync_left_room, sync_right_room, self._left_rooms, self._right_rooms)
+
+    @property
+    def left_rooms(self):  # type: () -> Tuple[int, ...]
+        return self._left_rooms
+
+    @property
+    def right_rooms(self):  # type: () -> Tuple[int, ...]
+        return self._right_rooms
+
+    @property
+    def rooms(self):  # type: () -> Tuple[int, ...]
+        return self._rooms
+
+    @property
+    def sync_date(self):  # type: () -> datetime.date
+        return self._sync_date
+
+    @property
+    def sync_left_room(self):  # type: () -> int
+        return self._sync_left_room
+
+    @property
+    def sync_right_room(self):  # type: () -> int
+        return self._sync_right_room
+
+    @property
+    def schedule(self):  # type: () -> DutySchedule
+        return self._schedule
+
+    def __contains__(self, room):  # type: (int) -> bool
+        return room in self._room_set
+
+    def rooms_for_date(self, dest_date):  # type: (datetime.date) -> Tuple[int, int]
+        return self._schedule.rooms_for_date(dest_date)
+
+    def duty_date(self, room, today):  # type: (int, datetime.date) -> datetime.date
+        return self._schedule.duty_date(room, today)
+
+    def replace(self, **changes):  # type: (...) -> RotationState
+        """
+        Copy-on-write: returns new snapshot with given fields replaced
+        """
+        fields = dict(
+            left_rooms=self._left_rooms,
+            right_rooms=self._right_rooms,
+            sync_date=self._sync_date,
+            sync_left_room=self._sync_left_room,
+            sync_right_room=self._sync_right_room
+        )
+        fields.update(changes)
+        return RotationState(**fields)
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}({self._sync_date}, {self._sync_left_room}, {self._sync_right_room})'
@@ -0,0 +1,42 @@
+__author__ = 'kranonetka'
+
+import threading
+import traceback
+
+if False:  # Type hinting
+    from typing import Callable, List  # noqa
+
+
+class Ticker:
+    """
+    One background thread for periodic jobs of many bots: every `interval` seconds each added job is called.
+    Jobs decide themselves whether they are due and should return quickly. A failed job is printed
+    and does not stop the others.
+    """
+
+    def __init__(self, interval=1.0):  # type: (float) -> None
+        self._interval = interval
+        self._lock = threading.Lock()
+        self._jobs = []  # type: List[Callable[[], None]]  # Replaced, never modified in place
+        self._stopped = threading.Event()
+
+        threading.Thread(target=self._run, name=self.__class__.__name__, daemon=True).start()
+
+    def add(self, job):  # type: (Callable[[], None]) -> None
+        with self._lock:
+            self._jobs = self._jobs + [job]
+
+    def discard(self, job):  # type: (Callable[[], None]) -> None
+        with self._lock:
+            self._jobs = [added for added in self._jobs if added != job]
+
+    def stop(self):  # type: () -> None
+        self._stopped.set()
+
+    def _run(self):
+        while not self._stopped.wait(self._interval):
+            for job in self._jobs:
+                try:
+                    job()
+                except Exception:  # noqa
+                    traceback.print_exc()
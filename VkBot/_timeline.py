@@ -0,0 +1,97 @@
+__author__ = 'kranonetka'
+
+from bisect import bisect_left, bisect_right
+
+from ._schedule import DutySchedule
+
+if False:  # Type hinting
+    import datetime  # noqa
+    from typing import Callable, Dict, List, Optional, Sequence, Tuple  # noqa
+
+
+class SyncTimeline:
+    """
+    Immutable history of sync points sorted by date. A point rules from its date up to the next point;
+    a point added later drops the ones it overlaps, so corrections win. Any date is answered by a bisect
+    over point dates and a closed-form lookup in the schedule of the found point.
+    Changes produce a new timeline via `append`.
+    """
+
+    __slots__ = ('_dates', '_points', '_schedules')
+
+    def __init__(self, dates=(), points=(), schedules=()):
+        """
+        Use `build` or `append` instead
+
+        :type dates: Sequence[datetime.date]
+        :param points: Sequence[Tuple[datetime.date, int, int, Tuple[int, ...]]] -- (date, left room, right room, rooms)
+        :type schedules: Sequence[DutySchedule]
+        """
+        self._dates = list(dates)  # type: List[datetime.date]
+        self._points = list(points)  # type: List[Tuple[datetime.date, int, int, Tuple[int, ...]]]
+        self._schedules = list(schedules)  # type: List[DutySchedule]
+
+    @classmethod
+    def build(cls, points, room_sets, split_rooms):
+        """
+        :param points: Sequence[Tuple[datetime.date, int, int, int]] -- (date, left room, right room, room set version)
+            in order they were added
+        :param room_sets: Dict[int, Tuple[int, ...]] -- sorted rooms by room set version
+        :param split_rooms: Callable[[Sequence[int]], Tuple[Tuple[int, ...], Tuple[int, ...]]] -- rooms by side
+        :rtype: SyncTimeline
+        """
+        timeline = cls()
+        for date, left_room, right_room, rooms_version in points:
+            rooms = room_sets[rooms_version]
+            timeline._insert(date, left_room, right_room, rooms, *split_rooms(rooms))
+        return timeline
+
+    @property
+    def first_date(self):  # type: () -> Optional[datetime.date]
+        return self._dates[0] if self._dates else None
+
+    @property
+    def last(self):  # type: () -> Optional[Tuple[datetime.date, int, int, Tuple[int, ...]]]
+        """
+        Latest point: (date, left room, right room, sorted rooms)
+        """
+        return self._points[-1] if self._points else None
+
+    def __len__(self):
+        return len(self._points)
+
+    def rooms_for_date(self, dest_date):  # type: (datetime.date) -> Optional[Tuple[int, int]]
+        """
+        Rooms on duty on the date, None if it is earlier than the first point
+        """
+        idx = bisect_right(self._dates, dest_date) - 1
+        if idx < 0:
+            return None
+        return self._schedules[idx].rooms_for_date(dest_date)
+
+    def append(self, date, left_room, right_room, left_rooms, right_rooms):
+        """
+        Copy-on-write: returns new timeline with the point added
+
+        :type date: datetime.date
+        :type left_room: int
+        :type right_room: int
+        :type left_rooms: Sequence[int]
+        :type right_rooms: Sequence[int]
+        :rtype: SyncTimeline
+        """
+        timeline = SyncTimeline(self._dates, self._points, self._schedules)
+        rooms = tuple(sorted(tuple(left_rooms) + tuple(right_rooms)))
+        timeline._insert(date, left_room, right_room, rooms, left_rooms, right_rooms)
+        return timeline
+
+    def _insert(self, date, left_room, right_room, rooms, left_rooms, right_rooms):
+        # type: (datetime.date, int, int, Tuple[int, ...], Sequence[int], Sequence[int]) -> None
+        idx = bisect_left(self._dates, date)
+        del self._dates[idx:], self._points[idx:], self._schedules[idx:]
+        self._dates.append(date)
+        self._points.append((date, left_room, right_room, rooms))
+        self._schedules.append(DutySchedule(date, left_room, right_room, left_rooms, right_rooms))
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}({len(self._points)} points, since {self.first_date})'
@@ -0,0 +1,102 @@
+__author__ = 'kranonetka'
+
+import atexit
+import threading
+import time
+import traceback
+
+if False:  # Type hinting
+    import datetime  # noqa
+    from typing import Callable, Dict, Optional  # noqa
+    from ._ticker import Ticker  # noqa
+
+
+class PeerTimeouts:
+    """
+    Per-peer request limiter: a peer may be answered again only after `timeout` since its last answer.
+    Last request times live in memory, changes are written behind to storage by `flush`,
+    which runs every `flush_interval` seconds in background (own thread or shared `ticker`) and at interpreter exit.
+    """
+
+    def __init__(self, timeout, clock, load, save, flush_interval, ticker=None):
+        """
+        :type timeout: datetime.timedelta
+        :param clock: Callable[[], datetime.datetime] -- current time
+        :param load: Callable[[], Dict[int, datetime.datetime]] -- read stored last requests
+        :param save: Callable[[Dict[int, Optional[datetime.datetime]], datetime.datetime], None] --
+            store changed last requests (None -- removed) and drop ones older than given datetime
+        :type flush_interval: float
+        :type ticker: Optional[Ticker]
+        """
+        self._timeout = timeout
+        self._clock = clock
+        self._save = save
+        self._flush_interval = flush_interval
+        self._ticker = ticker
+        self._flushed_at = time.monotonic()
+        self._lock = threading.Lock()
+        self._last_requests = load()  # type: Dict[int, datetime.datetime]
+        self._dirty = {}  # type: Dict[int, Optional[datetime.datetime]]
+        self._stopped = threading.Event()
+
+        if ticker is not None:
+            ticker.add(self._flush_if_due)
+        else:
+            threading.Thread(target=self._flush_periodically, name=self.__class__.__name__, daemon=True).start()
+        atexit.register(self.flush)
+
+    def acquire(self, peer_id):  # type: (int) -> bool
+        """
+        True and remember current time as last request if timeout for peer is exceeded, else False
+        """
+        now = self._clock()
+        with self._lock:
+            last_request = self._last_requests.get(peer_id)
+            if last_request is not None and now - last_request <= self._timeout:
+                return False
+            self._last_requests[peer_id] = self._dirty[peer_id] = now
+            return True
+
+    def reset(self, peer_id):  # type: (int) -> None
+        with self._lock:
+            if self._last_requests.pop(peer_id, None) is not None:
+                self._dirty[peer_id] = None
+
+    def flush(self):  # type: () -> None
+        expired_before = self._clock() - self._timeout
+        with self._lock:
+            dirty, self._dirty = self._dirty, {}
+            expired = [peer_id for peer_id, last_request in self._last_requests.items()
+                       if last_request < expired_before]
+            for peer_id in expired:
+                del self._last_requests[peer_id]
+
+        if not dirty and not expired:  # Idle: no write transaction
+            return
+        try:
+            self._save(dirty, expired_before)
+        except Exception:  # noqa
+            with self._lock:  # Retry with next flush, newer changes win
+                self._dirty = {**dirty, **self._dirty}
+            raise
+
+    def stop(self):  # type: () -> None
+        self._stopped.set()
+        if self._ticker is not None:
+            self._ticker.discard(self._flush_if_due)
+        atexit.unregister(self.flush)
+        self.flush()
+
+    def _flush_periodically(self):
+        while not self._stopped.wait(self._flush_interval):
+            try:
+                self.flush()
+            except Exception:  # noqa
+                traceback.print_exc()  # Changes are kept dirty and retried next time
+
+    def _flush_if_due(self):  # type: () -> None
+        now = time.monotonic()
+        if now - self._flushed_at < self._flush_interval:
+            return
+        self._flushed_at = now
+        self.flush()
@@ -0,0 +1,83 @@
+__author__ = 'kranonetka'
+
+import random
+import threading
+import time
+from collections import deque
+from contextlib import nullcontext
+
+from vk_api import VkApiGroup
+from vk_api.exceptions import ApiError, TOO_MANY_RPS_CODE
+
+if False:  # Type hinting
+    from requests import Session  # noqa
+    from typing import Any, Deque, Optional  # noqa
+
+GROUP_RPS_LIMIT = 20  # VK quota of requests per second with group token
+
+
+class RateLimiter:
+    """
+    At most `rate` acquisitions in any `period` seconds. Callers over the limit are given
+    the nearest free slot and sleep until it without holding the lock, so bursts queue up
+    """
+
+    def __init__(self, rate, period=1.0):  # type: (int, float) -> None
+        self._rate = rate
+        self._period = period
+        self._lock = threading.Lock()
+        self._slots = deque(maxlen=rate)  # type: Deque[float]  # Times of last `rate` acquisitions
+
+    def acquire(self):  # type: () -> float
+        """
+        Wait for a free slot. Returns seconds waited
+        """
+        with self._lock:
+            now = time.monotonic()
+            slot = now
+            if len(self._slots) == self._rate:
+                slot = max(now, self._slots[0] + self._period)
+            self._slots.append(slot)
+
+        delay = slot - now
+        if delay > 0:
+            time.sleep(delay)
+        return delay
+
+
+class VkTransport(VkApiGroup):
+    """
+    `VkApiGroup` for concurrent use: requests are not serialized by session lock and fixed delay,
+    rate is kept under group's quota by `RateLimiter` instead. Calls failed with error 6
+    (too many requests per second) are retried up to `max_retries` times with jittered exponential backoff
+    """
+
+    RPS_DELAY = 0  # Rate is limited by `RateLimiter`
+
+    def __init__(self, token, api_version, session=None, rps_limit=GROUP_RPS_LIMIT, max_retries=3, retry_delay=0.2):
+        """
+        :type token: str
+        :type api_version: str
+        :type session: Optional[Session]
+        :type rps_limit: int
+        :type max_retries: int
+        :param retry_delay: float -- seconds before the first retry, doubled for each next one
+        """
+        super(VkTransport, self).__init__(token=token, api_version=api_version, session=session)
+        self.lock = nullcontext()
+        del self.error_handlers[TOO_MANY_RPS_CODE]  # Default handler retries forever each 0.5 seconds
+        self._limiter = RateLimiter(rps_limit)
+        self._max_retries = max_retries
+        self._retry_delay = retry_delay
+
+    def method(self, method, values=None, **kwargs):  # type: (str, Optional[dict], ...) -> Any
+        attempt = 0
+        while True:
+            self._limiter.acquire()
+            try:
+                return super(VkTransport, self).method(method, values, **kwargs)
+            except ApiError as e:
+                if e.code != TOO_MANY_RPS_CODE or attempt >= self._max_retries:
+                    raise
+            time.sleep(self._retry_delay * 2 ** attempt * random.uniform(0.5, 1.5))
+            attempt += 1
@@ -1,21 +1,37 @@
 __author__ = 'kranonetka'
 
 import datetime
+import hashlib
+import threading
+import time
+import traceback
+from contextlib import contextmanager
 from itertools import zip_longest, filterfalse
 
-import git
 import pytz
-import vk_api
+from vk_api.bot_longpoll import VkBotLongPoll
 from vk_api.keyboard import VkKeyboard, VkKeyboardColor
 from vk_api.utils import get_random_id
 
 from VkBot import __author_id__ as AUTHOR_ID
-from .db import DBContext, DutyRooms, SyncTable, LastRequests, Admins
+from ._batcher import ApiCallBatcher
+from ._http import ApiUrlAdapter, VkHttpAdapter
+from ._profiles import UserProfileCache
+from ._responses import ResponseCache
+from ._revision import RevisionReader
+from ._scheduler import MidnightScheduler
+from ._state import RotationState
+from ._timeline import SyncTimeline
+from ._timeouts import PeerTimeouts
+from ._transport import VkTransport, GROUP_RPS_LIMIT
+from .db import GroupIdCache, open_storage
 
 if False:  # Type hinting
-    from sqlalchemy.orm import Session  # noqa
-    from typing import Tuple, Sequence, Optional, List, Any  # noqa
+    from typing import Tuple, Sequence, Optional, List, Any, Iterable, FrozenSet, Dict  # noqa
     from .parser._mention import Mention  # noqa
+    from ._ticker import Ticker  # noqa
+
+SEND_MAX_PEERS = 100  # VK limit of `peer_ids` in one messages.send
 
 WEEK_DAYS_MAPPING = {
     0: "Понедельник",
@@ -51,7 +67,23 @@ class Bot:
             right_rooms=tuple(range(620, 639)),
             today_notification_timeout=datetime.timedelta(minutes=15),
             tz=pytz.timezone('Asia/Tomsk'),
-            api_version='5.103'
+            api_version='5.103',
+            api_url=None,
+            api_timeout=10.0,
+            api_pool_size=10,
+            api_rps_limit=GROUP_RPS_LIMIT,
+            profiles_ttl=datetime.timedelta(hours=6),
+            profiles_cache_size=256,
+            admins_sync_interval=None,
+            rotation_sync_interval=None,
+            timeouts_flush_interval=datetime.timedelta(seconds=30),
+            group_id=None,
+            http_session=None,
+            revision=None,
+            ticker=None,
+            lazy_startup=False,
+            storage_backend='sqlite',
+            floor=6
     ):
         """
         :type access_token: str
@@ -61,6 +93,29 @@ class Bot:
         :param today_notification_timeout: datetime.timedelta
         :param tz: datetime.tzinfo
         :param api_version: str
+        :param api_url: Optional[str] -- base url to send VK API requests to instead of api.vk.ru
+        :param api_timeout: float -- seconds to wait for VK API connection and response
+        :param api_pool_size: int -- keep-alive connections to VK API, more concurrent requests wait for one.
+            `api_url`, `api_timeout` and `api_pool_size` are used only if `http_session` is not given
+        :param api_rps_limit: int -- VK API requests per second, over the limit requests are delayed
+        :param profiles_ttl: datetime.timedelta -- how long user names are cached
+        :param profiles_cache_size: int
+        :param admins_sync_interval: Optional[datetime.timedelta] -- how often to check admins changed by
+            other processes. None if this process is the only one
+        :param rotation_sync_interval: Optional[datetime.timedelta] -- how often to check rooms and sync point
+            changed by other processes. None if this process is the only one
+        :param timeouts_flush_interval: datetime.timedelta -- how often notification timeouts are saved to DB
+        :param group_id: Optional[int] -- id of bot's group, requested by token if not given
+        :param http_session: Optional[requests.Session] -- HTTP session to share between bots, its owner mounts
+            `VkHttpAdapter` (or `ApiUrlAdapter`) on it once
+        :param revision: Optional[RevisionReader] -- reader of the revision shown in help message to share
+            between bots, own one is opened if not given
+        :param ticker: Optional[Ticker] -- thread to share between bots for midnight announcements and saving
+            of notification timeouts, own threads are started if not given
+        :param lazy_startup: bool -- make no VK API calls before the bot is ready: group id resolved by token
+            is cached in local file, group description is pushed in background (see `wait_startup`)
+        :param storage_backend: str -- 'sqlite' or 'journal', see `VkBot.db.STORAGE_BACKENDS`
+        :param floor: int
         """
         self._timeout = today_notification_timeout
         self._tz = tz
@@ -69,18 +124,112 @@ class Bot:
         self._available_right_rooms = right_rooms
         self._available_rooms = left_rooms + right_rooms
 
-        self._session = vk_api.vk_api.VkApiGroup(token=access_token, api_version=api_version)
+        self._floor = floor
+        self._session = VkTransport(access_token, api_version, session=http_session, rps_limit=api_rps_limit)
+        if http_session is None:  # Own session, shared one keeps the pool its owner mounted
+            if api_url is not None:
+                ApiUrlAdapter.mount(self._session.http, api_url, timeout=api_timeout, pool_size=api_pool_size)
+            else:
+                VkHttpAdapter.mount(self._session.http, timeout=api_timeout, pool_size=api_pool_size)
+        self._api = ApiCallBatcher(self._session)
+        self._profiles = UserProfileCache(self._fetch_users, profiles_ttl.total_seconds(), profiles_cache_size)
         self._default_keyboard = self._get_keyboard()
-        self._group_id = self._get_group_id()
-        self._db_context = DBContext(str(self._group_id))
+        if group_id is None:
+            group_id = GroupIdCache().resolve(access_token, self._get_group_id) if lazy_startup \
+                else self._get_group_id()
+        self._group_id = group_id
+        self._storage = open_storage(storage_backend, str(self._group_id))
+        self._own_revision = revision is None
+        self._revision = revision if revision is not None else RevisionReader()
+        self._help_msg_cache = None  # type: Optional[Tuple[tuple, str]]
+
+        self._seed_if_empty()
+
+        self._admins_lock = threading.Lock()
+        self._admins_sync_interval = admins_sync_interval.total_seconds() if admins_sync_interval else None
+        self._admins_synced_at = time.monotonic()
+        self._admins_version = 0  # Bumped on every change of admins, invalidates help message
+        self._admins = frozenset()  # type: FrozenSet[int]
+        self._admin_names = {}  # type: Dict[int, Optional[str]]  # Replaced, never modified in place
+        self._load_admins()
+
+        self._timeouts = PeerTimeouts(
+            timeout=self._timeout,
+            clock=self._get_naive_now_datetime,
+            load=self._load_last_requests,
+            save=self._save_last_requests,
+            flush_interval=timeouts_flush_interval.total_seconds(),
+            ticker=ticker
+        )
+
+        self._state_lock = threading.RLock()  # Serializes writers, readers use current snapshot as is
+        self._rotation_sync_interval = rotation_sync_interval.total_seconds() if rotation_sync_interval else None
+        self._rotation_synced_at = time.monotonic()
+        self._responses = ResponseCache()  # Replies rendered from `_state`, invalidated by `_set_state`
+        self._load_rotation()  # `_state`, `_timeline` of past and current sync points and `_rotation_version`
+        self._record_sync_point()  # Storage made before sync history
+
+        self._announce_retry = None  # type: Optional[Tuple[datetime.date, List[int]]]  # Peers of failed packs
+        self._midnight_scheduler = MidnightScheduler(
+            clock=self._get_naive_now_datetime, job=self._announce_today, ticker=ticker
+        )
+
+        self._started = threading.Event()
+        if lazy_startup:
+            threading.Thread(target=self._deferred_startup, name=f'Bot-{self._group_id}-startup', daemon=True).start()
+        else:
+            self._update_description()
+            self._started.set()
+
+    def wait_startup(self, timeout=None):  # type: (Optional[float]) -> bool
+        """
+        Wait for start-up VK API calls deferred by `lazy_startup`. False if they are still running after `timeout`
+        """
+        return self._started.wait(timeout)
+
+    def close(self):  # type: () -> None
+        """
+        Stop background jobs, save pending notification timeouts and close storage
+        """
+        self._midnight_scheduler.stop()
+        self._timeouts.stop()
+        self._storage.close()
+        if self._own_revision:
+            self._revision.close()
+
+    @contextmanager
+    def batch(self):
+        """
+        Outgoing API calls made inside the block are sent together through `execute`
+        """
+        with self._api.batch():
+            yield
+
+    def prefetch_users(self, user_ids):  # type: (Sequence[int]) -> None
+        """
+        Resolve profiles of all given users with at most one `users.get` call
+        """
+        self._profiles.prefetch(user_ids)
+
+    @property
+    def profiles_stats(self):  # type: () -> dict
+        return self._profiles.stats
+
+    def create_long_poll(self, wait=25):  # type: (int) -> VkBotLongPoll
+        """
+        Bots Long Poll client of bot's group. Long Poll must be enabled in group settings
+        """
+        return VkBotLongPoll(self._session, self._group_id, wait=wait)
 
-        self.edit_group(description=self._build_help_msg())
-        self._fill_rooms_if_empty()
-        self._add_admin_if_empty()
-        self._resolve_sync()
+    def load_long_poll_ts(self):  # type: () -> Optional[str]
+        return self._get_setting('long_poll_ts')
+
+    def save_long_poll_ts(self, ts):  # type: (str) -> None
+        self._set_setting('long_poll_ts', str(ts))
 
     def show_list(self, peer_id):  # type: (int) -> None
-        msg = self._build_rooms_list_msg()
+        self._sync_rotation()
+        msg = self._responses.get(self.get_today_date(), self._build_rooms_list_msg)
         self._send_text(msg, peer_id)
 
     def help(self, peer_id):  # type: (int) -> None
@@ -88,79 +237,179 @@ class Bot:
 
         self._send_text(msg, peer_id)
 
-    def set_room(self, peer_id, room, date):  # type: (int, int, datetime.date) -> None
-        duty_rooms = self._get_all_duty_rooms()
-        if room not in duty_rooms:
-            msg = self._build_room_missing_msg(room)
-            self._send_text(msg, peer_id)
+    def subscribe(self, peer_id):  # type: (int) -> None
+        if self._storage.subscribe(peer_id):
+            msg = '🔔 Подписка оформлена: дежурящие комнаты будут приходить каждый день в полночь'
         else:
-            self._update_sync_table(room, date, duty_rooms)
-            self._reset_timeout(peer_id)
-            msg = self._build_room_setted_msg(room)
-            self._send_text(msg, peer_id)
+            msg = '🔔 Подписка уже оформлена'
+        self._send_text(msg, peer_id)
+
+    def unsubscribe(self, peer_id):  # type: (int) -> None
+        msg = '🔕 Подписка отменена' if self._storage.unsubscribe(peer_id) else '🔕 Подписка не оформлена'
+        self._send_text(msg, peer_id)
+
+    def set_room(self, peer_id, room, date):  # type: (int, int, datetime.date) -> None
+        self.set_rooms(peer_id, (room,), date)
+
+    def set_rooms(self, peer_id, rooms, date):  # type: (int, Sequence[int], datetime.date) -> None
+        """
+        Set rooms on duty for date: one sync table update for all of them and one reply.
+        Of several rooms on the same side the last one wins
+        """
+        with self._state_lock:
+            self._sync_rotation(force=True)
+            left_rooms, right_rooms = self._get_side_splitted_rooms()
+            side = {}
+            lines = []
+            for room in rooms:
+                if room in left_rooms:
+                    side['left_room'] = room
+                    lines.append(self._build_room_setted_msg(room))
+                elif room in right_rooms:
+                    side['right_room'] = room
+                    lines.append(self._build_room_setted_msg(room))
+                else:
+                    lines.append(self._build_room_missing_msg(room))
+
+            if side:
+                self._update_sync_table(side, date)
+                self._timeouts.reset(peer_id)
+            if lines:
+                self._send_text('\n'.join(lines), peer_id)
 
     def add_rooms(self, peer_id, rooms):  # type: (int, Sequence[int]) -> None
-        rooms_to_add = self._filter_adding_rooms(rooms)
-        if rooms_to_add:
-            today = self.get_today_date()
-            current_left, current_right = self._get_duty_rooms_for_date(today)
+        with self._state_lock:
+            self._sync_rotation(force=True)
+            rooms_to_add = self._filter_adding_rooms(rooms)
+            if rooms_to_add:
+                today = self.get_today_date()
+                current_left, current_right = self._get_duty_rooms_for_date(today)
+
+                left_rooms, right_rooms = self._split_rooms_by_side(sorted(set(self._state.rooms).union(rooms_to_add)))
+                state = self._state.replace(
+                    left_rooms=left_rooms,
+                    right_rooms=right_rooms,
+                    sync_date=today,
+                    sync_left_room=current_left,
+                    sync_right_room=current_right
+                )
+                self._commit_rotation(state, added_rooms=rooms_to_add)
 
-            self._add_rooms(rooms_to_add)
+                msg = self._build_added_msg(rooms_to_add)
+                self._send_text(msg, peer_id)
 
-            self._set_rooms_for_date(current_left, current_right, today)
+    def add_admin(self, peer_id, admin_id, alias=None):  # type: (int, int, Optional[str]) -> None
+        self.add_admins(peer_id, (admin_id,), {admin_id: alias} if alias else None)
 
-            msg = self._build_added_msg(rooms_to_add)
-            self._send_text(msg, peer_id)
+    def add_admins(self, peer_id, admin_ids, aliases=None):
+        """
+        Add all new admins in one transaction and report every given user in one reply
 
-    def add_admin(self, peer_id, admin_id):  # type: (int, int) -> None
-        if self.is_admin(admin_id):
-            msg = self._build_already_admin_msg(admin_id)
-            self._send_text(msg, peer_id)
-        else:
-            with self._db_context.session() as session:  # type: Session
-                session.add(Admins(admin_id=admin_id))
+        :type peer_id: int
+        :type admin_ids: Sequence[int]
+        :param aliases: Optional[Dict[int, str]] -- names users were mentioned with,
+            others are requested by `users.get`
+        """
+        admin_ids = tuple(dict.fromkeys(admin_ids))
+        if not admin_ids:
+            return
+        names = self._resolve_names(admin_ids, aliases or {})
+        with self._admins_lock:
+            self._sync_admins()
+            admins = self._admins
+            new_admin_ids = tuple(filterfalse(admins.__contains__, admin_ids))
+            if new_admin_ids:
+                version = self._storage.add_admins({admin_id: names[admin_id] for admin_id in new_admin_ids})
+                self._apply_admins_change(
+                    version, {**self._admin_names, **{admin_id: names[admin_id] for admin_id in new_admin_ids}}
+                )
 
-            msg = self._build_admin_added_msg(admin_id)
+            msg = '\n'.join(
+                self._build_already_admin_msg(admin_id, names[admin_id]) if admin_id in admins
+                else self._build_admin_added_msg(admin_id, names[admin_id])
+                for admin_id in admin_ids
+            )
             self._send_text(msg, peer_id)
 
-    def remove_admin(self, peer_id, admin_id):  # type: (int, int) -> None
-        if self.is_admin(admin_id):
-            with self._db_context.session() as session:  # type: Session
-                session.query(Admins). \
-                    filter(Admins.admin_id == admin_id). \
-                    delete(synchronize_session='fetch')
-            msg = self._build_admin_removed_msg(admin_id)
-            self._send_text(msg, peer_id)
-        else:
-            msg = self._build_not_a_admin_msg(admin_id)
+    def remove_admin(self, peer_id, admin_id, alias=None):  # type: (int, int, Optional[str]) -> None
+        self.remove_admins(peer_id, (admin_id,), {admin_id: alias} if alias else None)
+
+    def remove_admins(self, peer_id, admin_ids, aliases=None):
+        """
+        Remove all given admins in one transaction and report every given user in one reply
+
+        :type peer_id: int
+        :type admin_ids: Sequence[int]
+        :param aliases: Optional[Dict[int, str]] -- names users were mentioned with,
+            stored names or `users.get` are used for others
+        """
+        admin_ids = tuple(dict.fromkeys(admin_ids))
+        if not admin_ids:
+            return
+        stored_names = {admin_id: name for admin_id, name in self._admin_names.items()
+                        if name and not name.startswith('@')}
+        names = self._resolve_names(admin_ids, {**stored_names, **(aliases or {})})
+        with self._admins_lock:
+            self._sync_admins()
+            admins = self._admins
+            removed_admin_ids = tuple(filter(admins.__contains__, admin_ids))
+            if removed_admin_ids:
+                version = self._storage.remove_admins(removed_admin_ids)
+                self._apply_admins_change(version, {admin_id: name for admin_id, name in self._admin_names.items()
+                                                    if admin_id not in removed_admin_ids})
+
+            msg = '\n'.join(
+                self._build_admin_removed_msg(admin_id, names[admin_id]) if admin_id in admins
+                else self._build_not_a_admin_msg(admin_id, names[admin_id])
+                for admin_id in admin_ids
+            )
             self._send_text(msg, peer_id)
 
     def remove_rooms(self, peer_id, rooms_to_remove):  # type: (int, Sequence[int]) -> None
-        rooms_to_remove = self._filter_removing_rooms(rooms_to_remove)
-        if rooms_to_remove:
-            self._update_sync_before_removing(rooms_to_remove)
-            self._remove_rooms(rooms_to_remove)
-            msg = self._build_removed_msg(rooms_to_remove)
-            self._send_text(msg, peer_id)
+        with self._state_lock:
+            self._sync_rotation(force=True)
+            rooms_to_remove = self._filter_removing_rooms(rooms_to_remove)
+            if rooms_to_remove:
+                self._commit_rotation(self._state_after_removing(rooms_to_remove), removed_rooms=rooms_to_remove)
+                msg = self._build_removed_msg(rooms_to_remove)
+                self._send_text(msg, peer_id)
 
     def edit_group(self, **kwargs):  # type: (Any) -> None
         kwargs['group_id'] = self._group_id
-        self._session.method('groups.edit', kwargs)
+        self._api.method('groups.edit', kwargs)
 
     def notify_duty_date(self, peer_id, room):  # type: (int, int) -> None
-        if self._is_room_present(room):
-            date = self._get_duty_date(room)
-            msg = self._build_duty_date_msg(room, date)
+        self._sync_rotation()
+        today = self.get_today_date()
+        msg = self._responses.get(today, self._render_duty_date_reply, room, today)
+        self._send_text(msg, peer_id)
+
+    def show_schedule(self, peer_id, days):  # type: (int, int) -> None
+        self._sync_rotation()
+        today = self.get_today_date()
+        msg = self._responses.get(today, self._render_schedule_reply, today, days)
+        self._send_text(msg, peer_id)
+
+    def show_past_duty(self, peer_id, day, month, year=None):  # type: (int, int, int, Optional[int]) -> None
+        """
+        Rooms on duty on the date. Date without year is the latest one not after today
+        """
+        self._sync_rotation()
+        today = self.get_today_date()
+        if year is None:
+            year = today.year if (month, day) <= (today.month, today.day) else today.year - 1
+        try:
+            date = datetime.date(year, month, day)
+        except ValueError:
+            msg = f'❗ Даты {day:02}.{month:02}.{year} не существует'
         else:
-            msg = self._build_room_missing_msg(room)
+            msg = self._responses.get(today, self._render_past_duty_reply, date, today)
         self._send_text(msg, peer_id)
 
     def show_today_rooms(self, peer_id):  # type: (int) -> None
-        if self._is_timeout_exceeded(peer_id):
-            today = self.get_today_date()
-            left_room, right_room = self._get_duty_rooms_for_date(today)
-            self._update_timeout(peer_id)
-            msg = f'#Дежурство\n‼ Сегодня дежурят {left_room} и {right_room}'
+        if self._timeouts.acquire(peer_id):
+            self._sync_rotation()
+            msg = self._get_today_rooms_msg(self.get_today_date())
             self._send_text(msg, peer_id)
 
     def is_mentioned(self, mention):  # type: (Mention) -> bool
@@ -173,8 +422,8 @@ class Bot:
         return id == self._group_id
 
     def is_admin(self, id):  # type: (int) -> bool
-        with self._db_context.session() as session:  # type: Session
-            return session.query(Admins).filter(Admins.admin_id == id).first() is not None
+        self._sync_admins()
+        return id in self._admins
 
     def get_today_date(self):  # type: () -> datetime.date
         return self.get_now_datetime().date()
@@ -182,52 +431,48 @@ class Bot:
     def get_now_datetime(self):  # type: () -> datetime.datetime
         return datetime.datetime.now(tz=self._tz)
 
-    def _reset_timeout(self, peer_id):
-        with self._db_context.session() as session:  # type: Session
-            session.query(LastRequests). \
-                filter(LastRequests.peer_id == peer_id). \
-                delete(synchronize_session='fetch')
-
-    def _update_timeout(self, peer_id):  # type: (int) -> None
-        now = self.get_now_datetime()
-        with self._db_context.session() as session:  # type: Session
-            session.merge(LastRequests(peer_id=peer_id, request_date=now))
-
-    def _is_timeout_exceeded(self, peer_id):  # type: (int) -> bool
-        last_request = self._get_last_request_dt(peer_id)
-        if last_request is None:
-            return True
-
-        now = self.get_now_datetime()
-        now = now.replace(tzinfo=None)  # For subtracting
-        if (now - last_request) > self._timeout:
-            return True
-        return False
-
-    def _get_last_request_dt(self, peer_id):
-        with self._db_context.session() as session:  # type: Session
-            last_req = session.query(LastRequests). \
-                filter(LastRequests.peer_id == peer_id). \
-                first()  # type: Optional[LastRequests]
-            if last_req is not None:
-                return last_req.request_date
+    def _get_naive_now_datetime(self):  # type: () -> datetime.datetime
+        return self.get_now_datetime().replace(tzinfo=None)  # Same as stored in LastRequests
 
-    def _get_duty_date(self, room):  # type: (int) -> datetime.date
-        today = self.get_today_date()
+    def _load_last_requests(self):  # type: () -> Dict[int, datetime.datetime]
+        return self._storage.load_last_requests()
 
-        current_left_room, current_right_room = self._get_duty_rooms_for_date(today)
-        left_rooms, right_rooms = self._get_side_splitted_rooms()
-        if room in left_rooms:
-            containing_side = left_rooms
-            current_side_room = current_left_room
-        else:
-            containing_side = right_rooms
-            current_side_room = current_right_room
+    def _save_last_requests(self, last_requests, expired_before):
+        # type: (Dict[int, Optional[datetime.datetime]], datetime.datetime) -> None
+        self._storage.save_last_requests(last_requests, expired_before)
 
-        offset = (containing_side.index(room) - containing_side.index(current_side_room))
-        offset %= len(containing_side)
+    def _get_duty_date(self, room, today):  # type: (int, datetime.date) -> datetime.date
+        return self._state.duty_date(room, today)
 
-        return today + datetime.timedelta(days=offset)
+    def _render_duty_date_reply(self, room, today):  # type: (int, datetime.date) -> str
+        if self._is_room_present(room):
+            return self._build_duty_date_msg(room, self._get_duty_date(room, today))
+        return self._build_room_missing_msg(room)
+
+    def _render_schedule_reply(self, today, days):  # type: (datetime.date, int) -> str
+        return self._build_schedule_msg(self._state.schedule.rooms_for_range(today, days))
+
+    def _render_past_duty_reply(self, date, today):  # type: (datetime.date, datetime.date) -> str
+        timeline = self._timeline
+        rooms = timeline.rooms_for_date(date)
+        if rooms is None:
+            first_date = timeline.first_date
+            return f'Дежурства до {first_date.day} {MONTHS_MAPPING[first_date.month]} {first_date.year} не записаны'
+        if date < today:
+            verb = 'дежурили'
+        elif date == today:
+            verb = 'дежурят'
+        else:
+            verb = 'ориентировочно будут дежурить'
+        return '📆 {day} {month} {year} ({dayofweek}) {verb} {left} и {right}'.format(
+            day=date.day,
+            month=MONTHS_MAPPING[date.month],
+            year=date.year,
+            dayofweek=WEEK_DAYS_MAPPING[date.weekday()],
+            verb=verb,
+            left=rooms[0],
+            right=rooms[1]
+        )
 
     def _build_duty_date_msg(self, room, date):  # type: (int, datetime.date) -> str
         today = self.get_today_date()
@@ -242,28 +487,32 @@ class Bot:
             )
         return msg
 
-    def _build_admin_added_msg(self, admin_id):  # type: (int) -> str
-        user = self._get_user_info(admin_id)
-        msg = f'➕ Добавлен администратор: [id{user["id"]}|{user["first_name"]} {user["last_name"]}]'
+    def _build_schedule_msg(self, schedule):  # type: (Sequence[Tuple[datetime.date, int, int]]) -> str
+        msg = '📅 Расписание дежурств:\n'
+        msg += '\n'.join(
+            f'{date.day} {MONTHS_MAPPING[date.month]} ({WEEK_DAYS_MAPPING[date.weekday()]}): {left} и {right}'
+            for date, left, right in schedule
+        )
         return msg
 
-    def _build_already_admin_msg(self, admin_id):  # type: (int) -> str
-        user = self._get_user_info(admin_id)
-        msg = f'[id{user["id"]}|{user["first_name"]} {user["last_name"]}] уже является администратором'
-        return msg
+    @staticmethod
+    def _build_admin_added_msg(admin_id, name):  # type: (int, str) -> str
+        return f'➕ Добавлен администратор: [id{admin_id}|{name}]'
 
-    def _build_admin_removed_msg(self, admin_id):  # type: (int) -> str
-        user = self._get_user_info(admin_id)
-        msg = f'➖ Убран администратор: [id{user["id"]}|{user["first_name"]} {user["last_name"]}]'
-        return msg
+    @staticmethod
+    def _build_already_admin_msg(admin_id, name):  # type: (int, str) -> str
+        return f'[id{admin_id}|{name}] уже является администратором'
 
-    def _build_not_a_admin_msg(self, admin_id):  # type: (int) -> str
-        user = self._get_user_info(admin_id)
-        msg = f'[id{user["id"]}|{user["first_name"]} {user["last_name"]}] не является администратором'
-        return msg
+    @staticmethod
+    def _build_admin_removed_msg(admin_id, name):  # type: (int, str) -> str
+        return f'➖ Убран администратор: [id{admin_id}|{name}]'
+
+    @staticmethod
+    def _build_not_a_admin_msg(admin_id, name):  # type: (int, str) -> str
+        return f'[id{admin_id}|{name}] не является администратором'
 
     def _build_room_missing_msg(self, room):  # type: (int) -> str
-        return f'{room} комнаты нет среди дежурящих на 6-ом этаже'
+        return f'{room} комнаты нет среди дежурящих на {self._floor}-ом этаже'
 
     def _build_added_msg(self, rooms):  # type: (Sequence[int, ...]) -> str
         return '➕ Добавлены комнаты: ' + ', '.join(map(str, sorted(rooms)))
@@ -272,11 +521,23 @@ class Bot:
         return '➖ Убраны комнаты: ' + ', '.join(map(str, sorted(rooms)))
 
     def _build_help_msg(self):  # type: () -> str
+        revision, commit_message = self._revision.head()
+        key = (self._admins_version, revision)
+        cached = self._help_msg_cache
+        if cached is None or cached[0] != key:
+            cached = self._help_msg_cache = (key, self._render_help_msg(revision, commit_message))
+        return cached[1]
+
+    def _render_help_msg(self, revision, commit_message):  # type: (str, str) -> str
         msg = '❓ Команды:\n' \
               '🔸 Когда <комната> -- получить примерную дату, когда дежурит определённая комната\n' \
               'например, "Когда 601"\n' \
               '🔸 Помощь -- вывод этого сообщения\n' \
               '🔸 Кто дежурит (кто дежурит сегодня) -- вывод дежурящих сегодня комнат\n' \
+              '🔸 Кто дежурил <дата> -- вывод комнат, дежуривших в этот день\n' \
+              'например, "Кто дежурил 5 марта" или "Кто дежурил 05.03.2026"\n' \
+              '🔸 Расписание (расписание на месяц) -- вывод дежурящих комнат на неделю (месяц) вперёд\n' \
+              '🔸 Подписаться (отписаться) -- присылать (не присылать) дежурящие комнаты каждый день в полночь\n' \
               '\n' \
               '❓ Команды для администраторов:\n' \
               '🔹 <комнаты> -- установить, что комнаты дежурят сегодня\n' \
@@ -292,26 +553,50 @@ class Bot:
               '\n' \
               '🌟 Администраторы:\n'
 
-        admins = self._get_admins_info()
+        admins = self._get_admin_names()
 
         msg += '\n'.join(
-            f'[id{admin["id"]}|{admin["first_name"]} {admin["last_name"]}]'
-            for admin in admins
+            f'[id{admin_id}|{name}]'
+            for admin_id, name in admins
         )
 
-        repo = git.Repo('.')
-        last_commit = repo.head.commit
         msg += '\n' \
                '\n' \
-               f'revision: {last_commit.hexsha}\n' \
-               f'{last_commit.message.strip()}'
+               f'revision: {revision}\n' \
+               f'{commit_message}'
         return msg
 
+    def _update_description(self):  # type: () -> None
+        """
+        Push help message to group description unless the same one was pushed last time
+        """
+        description = self._build_help_msg()
+        description_hash = hashlib.sha1(description.encode('utf-8')).hexdigest()
+        if self._get_setting('description_hash') != description_hash:
+            self.edit_group(description=description)
+            self._set_setting('description_hash', description_hash)
+
+    def _deferred_startup(self):  # type: () -> None
+        try:
+            self._update_description()
+        except Exception:  # noqa
+            traceback.print_exc()
+        finally:
+            self._started.set()
+
+    def _get_setting(self, key):  # type: (str) -> Optional[str]
+        return self._storage.get_setting(key)
+
+    def _set_setting(self, key, value):  # type: (str, Optional[str]) -> None
+        self._storage.set_setting(key, value)
+
     def _is_room_present(self, room):  # type: (int) -> bool
-        duty_rooms = self._get_all_duty_rooms()
-        return room in duty_rooms
+        return room in self._state
 
-    def _update_sync_before_removing(self, rooms_to_remove):  # type: (Sequence[int]) -> None
+    def _state_after_removing(self, rooms_to_remove):  # type: (Sequence[int]) -> RotationState
+        """
+        Rotation without the rooms, synced today at the nearest remaining rooms from current ones
+        """
         current_rooms = set(self._get_all_duty_rooms())
         after_deleting_rooms = sorted(current_rooms - set(rooms_to_remove))
 
@@ -329,25 +614,13 @@ class Bot:
             default=right_rooms[0]
         )
 
-        with self._db_context.session() as session:  # type: Session
-            session.merge(
-                SyncTable(
-                    id=0,
-                    date=today,
-                    left_room=new_left,
-                    right_room=new_right
-                )
-            )
-
-    def _remove_rooms(self, rooms):  # type: (Sequence[int]) -> None
-        with self._db_context.session() as session:  # type: Session
-            session.query(DutyRooms). \
-                filter(DutyRooms.room.in_(rooms)). \
-                delete(synchronize_session='fetch')
-
-    def _add_rooms(self, rooms):  # type: (Sequence[int]) -> None
-        with self._db_context.session() as session:  # type: Session
-            session.add_all(DutyRooms(room=room) for room in rooms)
+        return self._state.replace(
+            left_rooms=left_rooms,
+            right_rooms=right_rooms,
+            sync_date=today,
+            sync_left_room=new_left,
+            sync_right_room=new_right
+        )
 
     def _filter_adding_rooms(self, rooms):  # type: (Sequence[int]) -> Tuple[int]
         allowed_rooms = tuple(filter(self._available_rooms.__contains__, rooms))
@@ -361,26 +634,33 @@ class Bot:
             duty_rooms = self._get_all_duty_rooms()
             return tuple(filter(duty_rooms.__contains__, allowed_rooms))
 
-    def _update_sync_table(self, room, date, current_rooms):  # type: (int, datetime.date, Sequence[int]) -> None
-        left_rooms, right_rooms = self._split_rooms_by_side(current_rooms)
-        if room in left_rooms:
-            side = dict(left_room=room)
-        else:
-            side = dict(right_room=room)
-
-        with self._db_context.session() as session:  # type: Session
-            session.merge(SyncTable(id=0, date=date, **side))
-
-    def _set_rooms_for_date(self, left_room, right_room, date):  # type: (int, int, datetime.date) -> None
-        with self._db_context.session() as session:  # type: Session
-            session.merge(
-                SyncTable(
-                    id=0,
-                    date=date,
-                    left_room=left_room,
-                    right_room=right_room
-                )
-            )
+    def _update_sync_table(self, side, date):  # type: (Dict[str, int], datetime.date) -> None
+        """
+        :param side: new `left_room` and/or `right_room` of sync point
+        """
+        state = self._state.replace(sync_date=date, **{f'sync_{key}': value for key, value in side.items()})
+        self._commit_rotation(state)
+
+    def _commit_rotation(self, state, added_rooms=(), removed_rooms=()):
+        """
+        Store admin's change of rotation with its sync history point in one transaction and make it current.
+        Called under state lock
+
+        :param state: RotationState -- rotation after the change
+        :param added_rooms: Sequence[int] -- rooms `state` has in addition to the current one
+        :param removed_rooms: Sequence[int] -- rooms of the current rotation `state` has not
+        """
+        version = self._storage.update_rotation(
+            state.sync_date, state.sync_left_room, state.sync_right_room, added_rooms, removed_rooms
+        )
+        if version != self._rotation_version + 1:  # Other process changed rotation too, take stored one
+            self._load_rotation()
+            return
+        self._timeline = self._timeline.append(
+            state.sync_date, state.sync_left_room, state.sync_right_room, state.left_rooms, state.right_rooms
+        )
+        self._rotation_version = version
+        self._set_state(state)  # Also drops replies rendered from the old timeline
 
     def _build_rooms_list_msg(self):  # type: () -> str
         left_rooms, right_rooms = self._get_side_splitted_rooms()
@@ -394,41 +674,176 @@ class Bot:
         return msg
 
     def _get_duty_rooms_for_date(self, dest_date):  # type: (datetime.date) -> Tuple[int, int]
-        with self._db_context.session() as session:  # type: Session
-            sync_info: SyncTable = session.query(SyncTable).first()
-            sync_date = sync_info.date  # type: datetime.date
-            sync_left_room = sync_info.left_room  # type: int
-            sync_right_room = sync_info.right_room  # type: int
+        return self._state.rooms_for_date(dest_date)
 
-        left_rooms, right_rooms = self._get_side_splitted_rooms()
+    def _get_today_rooms_msg(self, today):  # type: (datetime.date) -> str
+        """
+        Message with rooms on duty, rendered once per day and rotation state
+        """
+        return self._responses.get(today, self._build_today_rooms_msg, today)
+
+    def _build_today_rooms_msg(self, today):  # type: (datetime.date) -> str
+        left_room, right_room = self._get_duty_rooms_for_date(today)
+        return f'#Дежурство\n‼ Сегодня дежурят {left_room} и {right_room}'
 
-        left_idx = left_rooms.index(sync_left_room)
-        right_idx = right_rooms.index(sync_right_room)
+    def _set_state(self, state):  # type: (RotationState) -> None
+        self._state = state
+        self._responses.invalidate()
 
-        offset = (dest_date - sync_date).days
+    def _load_rotation(self):  # type: () -> None
+        """
+        Load rooms, sync point and sync history as of one rotation version, retried if other process
+        changed them in between
+        """
+        version = int(self._get_setting('rotation_version') or 0)
+        while True:
+            state = self._load_state()
+            points, room_sets = self._storage.load_sync_history()
+            loaded_version, version = version, int(self._get_setting('rotation_version') or 0)
+            if version == loaded_version:
+                break
+        self._timeline = SyncTimeline.build(points, room_sets, self._split_rooms_by_side)
+        self._rotation_version = version
+        self._set_state(state)  # Also drops replies rendered from the old timeline
+
+    def _sync_rotation(self, force=False):  # type: (bool) -> None
+        """
+        Reload rotation if other process changed it. Checks version row at most once per sync interval,
+        writers force the check under state lock before looking at current rotation
+        """
+        if self._rotation_sync_interval is None:
+            return
+        now = time.monotonic()
+        if not force and now - self._rotation_synced_at < self._rotation_sync_interval:
+            return
+        self._rotation_synced_at = now
+        if int(self._get_setting('rotation_version') or 0) != self._rotation_version:
+            with self._state_lock:
+                if int(self._get_setting('rotation_version') or 0) != self._rotation_version:
+                    self._load_rotation()
+
+    def _record_sync_point(self):  # type: () -> None
+        """
+        Add current sync point and rooms to sync history unless they are its latest point
+        """
+        state = self._state
+        if self._timeline.last == (state.sync_date, state.sync_left_room, state.sync_right_room, state.rooms):
+            return
+        self._storage.append_sync_point(state.sync_date, state.sync_left_room, state.sync_right_room, state.rooms)
+        self._timeline = self._timeline.append(
+            state.sync_date, state.sync_left_room, state.sync_right_room, state.left_rooms, state.right_rooms
+        )
+        self._responses.invalidate()
 
-        left_idx = (left_idx + offset) % len(left_rooms)
-        right_idx = (right_idx + offset) % len(right_rooms)
-        return left_rooms[left_idx], right_rooms[right_idx]
+    def _announce_today(self, today):  # type: (datetime.date) -> None
+        """
+        Precompute today's message and send it to all subscribers. Of several processes
+        sharing the database only the first one sends. Peers of packs that failed are kept
+        and the error is raised, so scheduler's retry of the same date sends to them only
+        and delivered subscribers get no duplicates. Kept peers are lost if the process stops
+        """
+        self._sync_rotation(force=True)
+        msg = self._get_today_rooms_msg(today)
+        retry = self._announce_retry
+        if retry is not None and retry[0] == today:
+            peer_ids = retry[1]
+        else:
+            announced_date = self._storage.get_setting('announced_date')
+            if not self._storage.claim_setting('announced_date', today.isoformat()):
+                return
+            try:
+                peer_ids = self._storage.load_subscriptions()
+            except Exception:
+                self._storage.set_setting('announced_date', announced_date)
+                raise
+
+        failed = self._send_text_to_peers(msg, peer_ids) if peer_ids else []
+        self._announce_retry = (today, [peer_id for pack, _ in failed for peer_id in pack]) if failed else None
+        if failed:
+            raise failed[0][1]
 
     def _get_side_splitted_rooms(self):  # type: () -> Tuple[Tuple[int], Tuple[int]]
-        all_rooms = self._get_all_duty_rooms()
-        return self._split_rooms_by_side(all_rooms)
+        state = self._state
+        return state.left_rooms, state.right_rooms
 
-    def _get_admins_info(self):  # type: () -> List[dict]
-        with self._db_context.session() as session:  # type: Session
-            admin_ids = session.query(Admins).all()
-            admin_ids = (admin.admin_id for admin in admin_ids)
-            admin_ids = ','.join(map(str, admin_ids))
-        return self._session.method('users.get', {'user_ids': admin_ids})
+    def _get_admin_names(self):  # type: () -> List[Tuple[int, str]]
+        """
+        Admins sorted by id with their stored names. Names missing in rows made by older versions
+        or stored as handles (`@id1`) are requested once and stored
+        """
+        admin_names = self._admin_names
+        missing = [admin_id for admin_id, name in admin_names.items() if not name or name.startswith('@')]
+        if missing:
+            fetched = self._resolve_names(missing, {})
+            self._storage.set_admin_names(fetched)
+            with self._admins_lock:
+                self._set_admins({
+                    admin_id: fetched.get(admin_id, name)
+                    for admin_id, name in self._admin_names.items()
+                })
+            admin_names = {**admin_names, **fetched}
+        return sorted(admin_names.items())
+
+    def _set_admins(self, admin_names):  # type: (Dict[int, Optional[str]]) -> None
+        self._admin_names = admin_names
+        self._admins = frozenset(admin_names)
+
+    def _apply_admins_change(self, version, admin_names):  # type: (int, Dict[int, Optional[str]]) -> None
+        """
+        Take admins after own change. If the stored version moved by more than this change,
+        other process changed admins too, and its rows are loaded
+        """
+        if version == self._admins_version + 1:
+            self._set_admins(admin_names)
+            self._admins_version = version
+        else:
+            self._load_admins()
 
-    def _get_user_info(self, user_id):  # type: (int) -> dict
-        return self._session.method('users.get', {'user_ids': user_id})[0]
+    def _resolve_names(self, user_ids, known_names):  # type: (Sequence[int], Dict[int, str]) -> Dict[int, str]
+        """
+        Names of users: known ones as is, the rest from profiles with at most one `users.get` call
+        """
+        names = {user_id: known_names[user_id] for user_id in user_ids if user_id in known_names}
+        unknown = [user_id for user_id in user_ids if user_id not in names]
+        if unknown:
+            for user in self._profiles.get_many(unknown):
+                names[user['id']] = f'{user["first_name"]} {user["last_name"]}'
+        return names
+
+    def _sync_admins(self):  # type: () -> None
+        """
+        Reload admins if other process changed them. Checks version row at most once per sync interval
+        """
+        if self._admins_sync_interval is None:
+            return
+        now = time.monotonic()
+        if now - self._admins_synced_at < self._admins_sync_interval:
+            return
+        self._admins_synced_at = now
+        if int(self._get_setting('admins_version') or 0) != self._admins_version:
+            self._load_admins()
+
+    def _load_admins(self):  # type: () -> None
+        version, admin_names = self._storage.load_admins()
+        self._set_admins(admin_names)
+        self._admins_version = version
+
+    def _fetch_users(self, user_ids):  # type: (Sequence[int]) -> List[dict]
+        return self._api.method('users.get', {'user_ids': ','.join(map(str, user_ids))})
 
     def _get_all_duty_rooms(self):  # type: () -> Tuple[int]
-        with self._db_context.session() as session:  # type: Session
-            rooms = session.query(DutyRooms).order_by(DutyRooms.room).all()  # type: Sequence[DutyRooms]
-            return tuple(room.room for room in rooms)
+        return self._state.rooms
+
+    def _load_state(self):  # type: () -> RotationState
+        rooms, (sync_date, sync_left_room, sync_right_room) = self._storage.load_rotation()
+        left_rooms, right_rooms = self._split_rooms_by_side(rooms)
+        return RotationState(
+            left_rooms=left_rooms,
+            right_rooms=right_rooms,
+            sync_date=sync_date,
+            sync_left_room=sync_left_room,
+            sync_right_room=sync_right_room
+        )
 
     def _split_rooms_by_side(self, rooms):  # type: (Sequence[int]) -> Tuple[Tuple[int], Tuple[int]]
         left_rooms = tuple(filter(self._available_left_rooms.__contains__, rooms))
@@ -444,30 +859,14 @@ class Bot:
         )
         return keyboard.get_keyboard()
 
-    def _fill_rooms_if_empty(self):
-        with self._db_context.session() as session:  # type: Session
-            if not session.query(DutyRooms).count():
-                session.add_all(DutyRooms(room=room) for room in self._available_rooms)
-
-    def _add_admin_if_empty(self):
-        with self._db_context.session() as session:  # type: Session
-            if not session.query(Admins).count():
-                session.add(Admins(admin_id=AUTHOR_ID))
-
-    def _resolve_sync(self):
-        with self._db_context.session() as session:  # type: Session
-            if session.query(SyncTable).first() is None:
-                left_rooms, right_rooms = self._get_side_splitted_rooms()
-                sync_info = SyncTable(
-                    id=0,
-                    date=datetime.date.today(),
-                    left_room=left_rooms[0],
-                    right_room=right_rooms[0]
-                )
-                session.add(sync_info)
+    def _seed_if_empty(self):
+        """
+        Default rooms, admin and sync point of fresh storage, checked and added in one transaction
+        """
+        self._storage.seed_if_empty(self._available_rooms, AUTHOR_ID, self._split_rooms_by_side, datetime.date.today())
 
     def _get_group_id(self):  # type: () -> int
-        response = self._session.method('groups.getById')
+        response = self._api.method('groups.getById')
         return response[0]['id']
 
     def _send_text(self, message, peer_id, **kwargs):  # type: (str, int, dict) -> None
@@ -479,7 +878,35 @@ class Bot:
             peer_id=peer_id,
             **kwargs
         )
-        self._session.method('messages.send', kwargs)
+        self._api.call('messages.send', kwargs)
+
+    def _send_text_to_peers(self, message, peer_ids):
+        """
+        Same message to many peers: `peer_ids` packs of messages.send, all sent through one `execute`.
+        A failed pack does not fail the others
+
+        :type message: str
+        :type peer_ids: Sequence[int]
+        :return: List[Tuple[Sequence[int], Exception]] -- failed packs of peers with their errors
+        """
+        with self._api.batch():
+            sent = []
+            for start in range(0, len(peer_ids), SEND_MAX_PEERS):
+                pack = peer_ids[start:start + SEND_MAX_PEERS]
+                sent.append((pack, self._api.call('messages.send', dict(
+                    random_id=get_random_id(),
+                    keyboard=VkKeyboard.get_empty_keyboard(),
+                    message=message,
+                    peer_ids=','.join(map(str, pack))
+                ))))
+
+            failed = []
+            for pack, api_call in sent:
+                try:
+                    api_call.result()  # Read inside the batch, so its exit does not raise the error
+                except Exception as e:
+                    failed.append((pack, e))
+        return failed
 
     def _build_room_setted_msg(self, room):
         return f'✔ {room} комната установлена дежурящей сегодня'
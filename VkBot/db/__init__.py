@@ -1,3 +1,9 @@
 __author__ = 'kranonetka'
 
-from ._db import DBContext, DutyRooms, SyncTable, LastRequests, Admins
+from ._backends import STORAGE_BACKENDS, open_storage
+from ._db import DBContext, DutyRooms, SyncTable, LastRequests, Admins, Settings, Subscriptions, RoomSets, \
+    SyncHistory
+from ._group_ids import GroupIdCache
+from ._journal import JournalStorage
+from ._sqlite import sqlite_transaction
+from ._storage import Storage, SqlStorage
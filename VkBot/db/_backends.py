@@ -0,0 +1,26 @@
+__author__ = 'kranonetka'
+
+from ._journal import JournalStorage
+from ._storage import SqlStorage
+
+if False:  # Type hinting
+    from ._storage import Storage  # noqa
+
+STORAGE_BACKENDS = {
+    'sqlite': SqlStorage,  # `<context name>.sqlite`, may be shared by several processes
+    'journal': JournalStorage,  # `<context name>.journal` and `.snapshot`, one process only
+}
+
+
+def open_storage(backend, context_name, **options):  # type: (str, str, object) -> Storage
+    """
+    :param backend: str -- key of STORAGE_BACKENDS
+    :param context_name: str -- files of storage are named by it
+    :param options: passed to backend class
+    """
+    try:
+        storage_class = STORAGE_BACKENDS[backend]
+    except KeyError:
+        raise ValueError(f'Unknown storage backend {backend!r}, expected one of {", ".join(STORAGE_BACKENDS)}') \
+            from None
+    return storage_class(context_name, **options)
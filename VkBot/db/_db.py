@@ -2,11 +2,15 @@ __author__ = 'kranonetka'
 
 from contextlib import contextmanager
 
-from sqlalchemy import create_engine, Column, Integer, DateTime, Date
+from sqlalchemy import create_engine, event, inspect, text, Column, Integer, DateTime, Date, String
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import QueuePool
+
+from .._metrics import DB_SECONDS
 
 if False:  # Type hinting
+    from sqlalchemy.engine import Connection  # noqa
     from sqlalchemy.orm.session import Session  # noqa
 
 Base = declarative_base()
@@ -31,27 +35,114 @@ class SyncTable(Base):
     right_room = Column(Integer, nullable=False)
 
 
+class RoomSets(Base):
+    __tablename__ = 'RoomSets'
+    version = Column(Integer, primary_key=True)
+    rooms = Column(String, nullable=False)  # Comma separated, ascending
+
+
+class SyncHistory(Base):
+    __tablename__ = 'SyncHistory'
+    id = Column(Integer, primary_key=True)  # Order of adding, later of points with the same date wins
+    date = Column(Date, nullable=False, index=True)
+    left_room = Column(Integer, nullable=False)
+    right_room = Column(Integer, nullable=False)
+    rooms_version = Column(Integer, nullable=False)  # RoomSets.version
+
+
 class Admins(Base):
     __tablename__ = 'Admins'
     admin_id = Column(Integer, primary_key=True, nullable=False)
+    name = Column(String, nullable=True)  # As mentioned when added, filled from users.get for older rows
+
+
+class Subscriptions(Base):
+    __tablename__ = 'Subscriptions'
+    peer_id = Column(Integer, primary_key=True, nullable=False)  # Gets today's duty rooms every midnight
+
+
+class Settings(Base):
+    __tablename__ = 'Settings'
+    key = Column(String, primary_key=True, nullable=False)
+    value = Column(String, nullable=True)
 
 
 class DBContext:
-    def __init__(self, context_name):  # type: (str) -> None
-        engine = create_engine(f'sqlite:///{context_name}.sqlite', echo=False)
+    def __init__(self, context_name, performance=True, busy_timeout=5.0, pool_size=5):
+        """
+        :type context_name: str
+        :param performance: bool -- WAL journal with synchronous=NORMAL and explicitly sized connection pool,
+            otherwise SQLite and SQLAlchemy defaults
+        :param busy_timeout: float -- seconds to wait for lock held by other connection
+        :param pool_size: int -- connections kept open
+        """
+        self._busy_timeout = busy_timeout
+
+        if performance:
+            engine = create_engine(
+                f'sqlite:///{context_name}.sqlite',
+                echo=False,
+                poolclass=QueuePool,
+                pool_size=pool_size,
+                max_overflow=pool_size,
+                connect_args=dict(timeout=busy_timeout, check_same_thread=False)
+            )
+            event.listen(engine, 'connect', self._tune_connection)
+        else:
+            engine = create_engine(f'sqlite:///{context_name}.sqlite', echo=False)
 
         Base.metadata.create_all(engine)
+        self._add_missing_columns(engine)
 
+        self._engine = engine
         self._SessionMaker = sessionmaker(bind=engine)
 
     @contextmanager
     def session(self):  # type: () -> Session
-        session = self._SessionMaker()  # type: Session
-        try:
-            yield session
-            session.commit()
-        except:  # noqa
-            session.rollback()
-            raise
-        finally:
-            session.close()
+        with DB_SECONDS.time('session'):
+            session = self._SessionMaker()  # type: Session
+            try:
+                yield session
+                session.commit()
+            except:  # noqa
+                session.rollback()
+                raise
+            finally:
+                session.close()
+
+    @contextmanager
+    def read(self):  # type: () -> Connection
+        """
+        Core connection for read-only queries: nothing is committed, transaction is rolled back on exit
+        """
+        with DB_SECONDS.time('read'), self._engine.connect() as connection:  # type: Connection
+            yield connection
+
+    def close(self):  # type: () -> None
+        """
+        Close pooled connections
+        """
+        self._engine.dispose()
+
+    @staticmethod
+    def _add_missing_columns(engine):
+        """
+        Migrate databases created by older versions: columns added to models since then are
+        appended to existing tables. Such columns must be nullable
+        """
+        inspector = inspect(engine)
+        with engine.begin() as connection:  # type: Connection
+            for table in Base.metadata.sorted_tables:
+                existing = {column['name'] for column in inspector.get_columns(table.name)}
+                for column in table.columns:
+                    if column.name not in existing:
+                        column_type = column.type.compile(dialect=engine.dialect)
+                        connection.execute(text(f'ALTER TABLE "{table.name}" ADD COLUMN "{column.name}" {column_type}'))
+
+    def _tune_connection(self, dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute('PRAGMA journal_mode=WAL')
+        cursor.execute('PRAGMA synchronous=NORMAL')
+        cursor.execute(f'PRAGMA busy_timeout={int(self._busy_timeout * 1000)}')
+        cursor.execute('PRAGMA temp_store=MEMORY')
+        cursor.close()
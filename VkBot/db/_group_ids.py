@@ -0,0 +1,50 @@
+__author__ = 'kranonetka'
+
+import hashlib
+
+from ._sqlite import sqlite_transaction
+
+if False:  # Type hinting
+    from typing import Callable, Optional  # noqa
+
+
+class GroupIdCache:
+    """
+    Group ids resolved by access tokens, kept in SQLite file apart from groups' databases since those
+    are named by group id. Tokens are stored as SHA-256 digests
+    """
+
+    def __init__(self, db_path='group_ids.sqlite'):  # type: (str) -> None
+        self._db_path = db_path
+        with sqlite_transaction(self._db_path) as connection:
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS GroupIds (token_hash TEXT PRIMARY KEY, group_id INTEGER NOT NULL)'
+            )
+
+    def get(self, access_token):  # type: (str) -> Optional[int]
+        with sqlite_transaction(self._db_path) as connection:
+            row = connection.execute(
+                'SELECT group_id FROM GroupIds WHERE token_hash = ?', (self._hash(access_token),)
+            ).fetchone()
+        return row[0] if row is not None else None
+
+    def set(self, access_token, group_id):  # type: (str, int) -> None
+        with sqlite_transaction(self._db_path) as connection:
+            connection.execute(
+                'INSERT OR REPLACE INTO GroupIds (token_hash, group_id) VALUES (?, ?)',
+                (self._hash(access_token), group_id)
+            )
+
+    def resolve(self, access_token, fetch):  # type: (str, Callable[[], int]) -> int
+        """
+        Cached group id of token, `fetch` is called only for tokens seen for the first time
+        """
+        group_id = self.get(access_token)
+        if group_id is None:
+            group_id = fetch()
+            self.set(access_token, group_id)
+        return group_id
+
+    @staticmethod
+    def _hash(access_token):  # type: (str) -> str
+        return hashlib.sha256(access_token.encode('utf-8')).hexdigest()
@@ -0,0 +1,371 @@
+__author__ = 'kranonetka'
+
+import atexit
+import mmap
+import os
+import pickle
+import struct
+import threading
+import zlib
+from pathlib import Path
+
+from ._storage import Storage
+
+try:
+    import fcntl
+except ImportError:  # Windows: nothing keeps a second process off the files
+    fcntl = None
+
+if False:  # Type hinting
+    import datetime  # noqa
+    from typing import BinaryIO, Callable, Dict, Iterable, List, Optional, Sequence, Set, Tuple  # noqa
+
+# Journal record: header, then pickled (sequence number, events of one transaction)
+RECORD_HEADER = struct.Struct('<II')  # Payload length, CRC32 of payload
+
+# Event types, event is (type, payload)
+ADD_ROOMS = 1  # Rooms
+REMOVE_ROOMS = 2  # Rooms
+SET_SYNC = 3  # (date, left room, right room)
+SET_ADMINS = 4  # {admin id: name}, added or renamed
+REMOVE_ADMINS = 5  # Admin ids
+SAVE_LAST_REQUESTS = 6  # ({peer id: request date or None}, expired before)
+SET_SETTING = 7  # (key, value)
+SUBSCRIBE = 8  # Peer id
+UNSUBSCRIBE = 9  # Peer id
+APPEND_SYNC_POINT = 10  # (date, left room, right room, room set version, sorted rooms or None if version is not new)
+
+
+class JournalStorage(Storage):
+    """
+    State is kept in memory. Every transaction is appended to `<context name>.journal` as a record of
+    typed events, flushed to OS before the call returns. Every `compact_every` records the whole state is
+    written to `<context name>.snapshot` and the journal is emptied. On open the snapshot is read through
+    mmap and journal records newer than it are replayed; a torn record at the end is cut off.
+    Files are locked while open, so only one process can use them
+    """
+
+    def __init__(self, context_name, compact_every=10000, fsync=False):
+        """
+        :type context_name: str
+        :param compact_every: int -- journal records between snapshots
+        :param fsync: bool -- fsync every record, otherwise it survives crash of the process but not of the OS
+        """
+        self._journal_path = Path(f'{context_name}.journal')
+        self._snapshot_path = Path(f'{context_name}.snapshot')
+        self._compact_every = compact_every
+        self._fsync = fsync
+        self._lock = threading.Lock()
+
+        self._rooms = set()  # type: Set[int]
+        self._sync = None  # type: Optional[Tuple[datetime.date, int, int]]
+        self._admins = {}  # type: Dict[int, Optional[str]]
+        self._last_requests = {}  # type: Dict[int, datetime.datetime]
+        self._settings = {}  # type: Dict[str, Optional[str]]
+        self._subscriptions = set()  # type: Set[int]
+        self._sync_history = []  # type: List[Tuple[datetime.date, int, int, int]]
+        self._room_sets = {}  # type: Dict[int, Tuple[int, ...]]
+        self._seq = 0  # Sequence number of the last applied record
+        self._records = 0  # Records in journal
+
+        self._journal = self._journal_path.open('ab')  # type: BinaryIO
+        if fcntl is not None:
+            try:
+                fcntl.flock(self._journal.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                self._journal.close()
+                raise RuntimeError(f'{self._journal_path} is used by another process') from None
+
+        self._load_snapshot()
+        self._replay_journal()
+        atexit.register(self.close)
+
+    def seed_if_empty(self, rooms, admin_id, split_rooms, today):
+        with self._lock:
+            events = []
+            current_rooms = self._rooms
+            if not current_rooms:
+                events.append((ADD_ROOMS, tuple(rooms)))
+                current_rooms = set(rooms)
+            if not self._admins:
+                events.append((SET_ADMINS, {admin_id: None}))
+            if self._sync is None:
+                left_rooms, right_rooms = split_rooms(sorted(current_rooms))
+                events.append((SET_SYNC, (today, left_rooms[0], right_rooms[0])))
+            self._commit(events)
+
+    def load_rotation(self):  # type: () -> Tuple[Tuple[int, ...], Tuple[datetime.date, int, int]]
+        with self._lock:
+            return tuple(sorted(self._rooms)), self._sync
+
+    def add_rooms(self, rooms):  # type: (Sequence[int]) -> None
+        with self._lock:
+            self._commit([(ADD_ROOMS, tuple(rooms))])
+
+    def remove_rooms(self, rooms):  # type: (Sequence[int]) -> None
+        with self._lock:
+            self._commit([(REMOVE_ROOMS, tuple(rooms))])
+
+    def set_sync(self, date, left_room, right_room):  # type: (datetime.date, int, int) -> None
+        with self._lock:
+            self._commit([(SET_SYNC, (date, left_room, right_room))])
+
+    def load_sync_history(self):
+        # type: () -> Tuple[List[Tuple[datetime.date, int, int, int]], Dict[int, Tuple[int, ...]]]
+        with self._lock:
+            return list(self._sync_history), dict(self._room_sets)
+
+    def append_sync_point(self, date, left_room, right_room, rooms):
+        # type: (datetime.date, int, int, Sequence[int]) -> int
+        with self._lock:
+            event = self._sync_point_event(date, left_room, right_room, rooms)
+            self._commit([event])
+            return event[1][3]
+
+    def update_rotation(self, date, left_room, right_room, added_rooms=(), removed_rooms=()):
+        # type: (datetime.date, int, int, Sequence[int], Sequence[int]) -> int
+        with self._lock:
+            rooms = self._rooms.difference(removed_rooms).union(added_rooms)
+            version = int(self._settings.get('rotation_version') or 0) + 1
+            self._commit([
+                (REMOVE_ROOMS, tuple(removed_rooms)),
+                (ADD_ROOMS, tuple(added_rooms)),
+                (SET_SYNC, (date, left_room, right_room)),
+                self._sync_point_event(date, left_room, right_room, rooms),
+                (SET_SETTING, ('rotation_version', str(version)))
+            ])
+            return version
+
+    def _sync_point_event(self, date, left_room, right_room, rooms):
+        # type: (datetime.date, int, int, Iterable[int]) -> Tuple[int, tuple]
+        """
+        APPEND_SYNC_POINT event, rooms get new room set version unless equal to the latest one
+        """
+        rooms = tuple(sorted(rooms))
+        version = max(self._room_sets, default=0)
+        if not version or self._room_sets[version] != rooms:
+            version += 1
+        else:
+            rooms = None
+        return APPEND_SYNC_POINT, (date, left_room, right_room, version, rooms)
+
+    def load_admins(self):  # type: () -> Tuple[int, Dict[int, Optional[str]]]
+        with self._lock:
+            return self._admins_version(), dict(self._admins)
+
+    def add_admins(self, names):  # type: (Dict[int, Optional[str]]) -> int
+        with self._lock:
+            version = self._admins_version() + 1
+            self._commit([(SET_ADMINS, dict(names)), (SET_SETTING, ('admins_version', str(version)))])
+            return version
+
+    def remove_admins(self, admin_ids):  # type: (Sequence[int]) -> int
+        with self._lock:
+            version = self._admins_version() + 1
+            self._commit([(REMOVE_ADMINS, tuple(admin_ids)), (SET_SETTING, ('admins_version', str(version)))])
+            return version
+
+    def set_admin_names(self, names):  # type: (Dict[int, str]) -> None
+        with self._lock:
+            self._commit([(SET_ADMINS, {admin_id: name for admin_id, name in names.items()
+                                        if admin_id in self._admins})])
+
+    def _admins_version(self):  # type: () -> int
+        return int(self._settings.get('admins_version') or 0)
+
+    def load_last_requests(self):  # type: () -> Dict[int, datetime.datetime]
+        with self._lock:
+            return dict(self._last_requests)
+
+    def save_last_requests(self, last_requests, expired_before):
+        # type: (Dict[int, Optional[datetime.datetime]], datetime.datetime) -> None
+        with self._lock:
+            self._commit([(SAVE_LAST_REQUESTS, (dict(last_requests), expired_before))])
+
+    def get_setting(self, key):  # type: (str) -> Optional[str]
+        return self._settings.get(key)
+
+    def set_setting(self, key, value):  # type: (str, Optional[str]) -> None
+        with self._lock:
+            self._commit([(SET_SETTING, (key, value))])
+
+    def claim_setting(self, key, value):  # type: (str, str) -> bool
+        with self._lock:
+            if self._settings.get(key) == value:
+                return False
+            self._commit([(SET_SETTING, (key, value))])
+            return True
+
+    def subscribe(self, peer_id):  # type: (int) -> bool
+        with self._lock:
+            if peer_id in self._subscriptions:
+                return False
+            self._commit([(SUBSCRIBE, peer_id)])
+            return True
+
+    def unsubscribe(self, peer_id):  # type: (int) -> bool
+        with self._lock:
+            if peer_id not in self._subscriptions:
+                return False
+            self._commit([(UNSUBSCRIBE, peer_id)])
+            return True
+
+    def load_subscriptions(self):  # type: () -> List[int]
+        with self._lock:
+            return sorted(self._subscriptions)
+
+    def compact(self):  # type: () -> None
+        """
+        Write snapshot of the whole state and empty the journal
+        """
+        with self._lock:
+            self._compact()
+
+    def close(self, compact=True):  # type: (bool) -> None
+        """
+        :param compact: write snapshot, so the next open has nothing to replay
+        """
+        with self._lock:
+            if self._journal.closed:
+                return
+            if compact and self._records:
+                self._compact()
+            self._journal.close()  # Releases the lock
+        atexit.unregister(self.close)
+
+    def _commit(self, events):  # type: (List[Tuple[int, object]]) -> None
+        """
+        Append events as one record, then apply them. Must be called under lock
+        """
+        if not events:
+            return
+        if self._journal.closed:
+            raise RuntimeError(f'{self._journal_path} is closed')
+
+        payload = pickle.dumps((self._seq + 1, events), protocol=pickle.HIGHEST_PROTOCOL)
+        self._journal.write(RECORD_HEADER.pack(len(payload), zlib.crc32(payload)) + payload)
+        self._journal.flush()
+        if self._fsync:
+            os.fsync(self._journal.fileno())
+
+        self._seq += 1
+        self._records += 1
+        for event_type, event in events:
+            self._APPLY[event_type](self, event)
+
+        if self._records >= self._compact_every:
+            self._compact()
+
+    def _compact(self):  # type: () -> None
+        state = dict(
+            rooms=sorted(self._rooms),
+            sync=self._sync,
+            admins=self._admins,
+            last_requests=self._last_requests,
+            settings=self._settings,
+            subscriptions=sorted(self._subscriptions),
+            sync_history=self._sync_history,
+            room_sets=self._room_sets
+        )
+        tmp_path = self._snapshot_path.with_name(self._snapshot_path.name + '.tmp')
+        with tmp_path.open('wb') as fp:
+            pickle.dump((self._seq, state), fp, protocol=pickle.HIGHEST_PROTOCOL)
+            fp.flush()
+            os.fsync(fp.fileno())
+        os.replace(tmp_path, self._snapshot_path)
+        # Records left by a crash right here are older than the snapshot and skipped on replay
+        self._journal.truncate(0)
+        self._records = 0
+
+    def _load_snapshot(self):  # type: () -> None
+        if not self._snapshot_path.exists() or not self._snapshot_path.stat().st_size:
+            return
+        with self._snapshot_path.open('rb') as fp, mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            self._seq, state = pickle.loads(data)
+        self._rooms = set(state['rooms'])
+        self._sync = state['sync']
+        self._admins = state['admins']
+        self._last_requests = state['last_requests']
+        self._settings = state['settings']
+        self._subscriptions = set(state['subscriptions'])
+        self._sync_history = state.get('sync_history', [])  # Snapshots written before sync history have none
+        self._room_sets = state.get('room_sets', {})
+
+    def _replay_journal(self):  # type: () -> None
+        size = self._journal_path.stat().st_size
+        if not size:
+            return
+        end = 0
+        with self._journal_path.open('rb') as fp, mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            while end + RECORD_HEADER.size <= size:
+                length, crc = RECORD_HEADER.unpack_from(data, end)
+                start = end + RECORD_HEADER.size
+                payload = data[start:start + length]
+                if len(payload) < length or zlib.crc32(payload) != crc:
+                    break
+                seq, events = pickle.loads(payload)
+                if seq > self._seq:
+                    for event_type, event in events:
+                        self._APPLY[event_type](self, event)
+                    self._seq = seq
+                self._records += 1
+                end = start + length
+        if end < size:  # Torn write of the last record
+            self._journal.truncate(end)
+
+    def _apply_add_rooms(self, rooms):  # type: (Sequence[int]) -> None
+        self._rooms.update(rooms)
+
+    def _apply_remove_rooms(self, rooms):  # type: (Sequence[int]) -> None
+        self._rooms.difference_update(rooms)
+
+    def _apply_set_sync(self, sync):  # type: (Tuple[datetime.date, int, int]) -> None
+        self._sync = sync
+
+    def _apply_set_admins(self, names):  # type: (Dict[int, Optional[str]]) -> None
+        self._admins.update(names)
+
+    def _apply_remove_admins(self, admin_ids):  # type: (Sequence[int]) -> None
+        for admin_id in admin_ids:
+            self._admins.pop(admin_id, None)
+
+    def _apply_save_last_requests(self, event):
+        # type: (Tuple[Dict[int, Optional[datetime.datetime]], datetime.datetime]) -> None
+        last_requests, expired_before = event
+        for peer_id, request_date in last_requests.items():
+            if request_date is None:
+                self._last_requests.pop(peer_id, None)
+            else:
+                self._last_requests[peer_id] = request_date
+        self._last_requests = {peer_id: request_date for peer_id, request_date in self._last_requests.items()
+                               if request_date >= expired_before}
+
+    def _apply_set_setting(self, setting):  # type: (Tuple[str, Optional[str]]) -> None
+        key, value = setting
+        self._settings[key] = value
+
+    def _apply_subscribe(self, peer_id):  # type: (int) -> None
+        self._subscriptions.add(peer_id)
+
+    def _apply_unsubscribe(self, peer_id):  # type: (int) -> None
+        self._subscriptions.discard(peer_id)
+
+    def _apply_append_sync_point(self, event):
+        # type: (Tuple[datetime.date, int, int, int, Optional[Tuple[int, ...]]]) -> None
+        date, left_room, right_room, version, rooms = event
+        if rooms is not None:
+            self._room_sets[version] = rooms
+        self._sync_history.append((date, left_room, right_room, version))
+
+    _APPLY = {
+        ADD_ROOMS: _apply_add_rooms,
+        REMOVE_ROOMS: _apply_remove_rooms,
+        SET_SYNC: _apply_set_sync,
+        SET_ADMINS: _apply_set_admins,
+        REMOVE_ADMINS: _apply_remove_admins,
+        SAVE_LAST_REQUESTS: _apply_save_last_requests,
+        SET_SETTING: _apply_set_setting,
+        SUBSCRIBE: _apply_subscribe,
+        UNSUBSCRIBE: _apply_unsubscribe,
+        APPEND_SYNC_POINT: _apply_append_sync_point,
+    }  # type: Dict[int, Callable[[JournalStorage, object], None]]
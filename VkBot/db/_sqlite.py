@@ -0,0 +1,21 @@
+__author__ = 'kranonetka'
+
+import sqlite3
+from contextlib import contextmanager
+
+
+@contextmanager
+def sqlite_transaction(db_path, timeout=5.0):
+    """
+    Connection to SQLite file for one transaction: committed on exit, rolled back on error, then closed
+
+    :type db_path: str
+    :param timeout: float -- seconds to wait for lock of other connection
+    :rtype: sqlite3.Connection
+    """
+    connection = sqlite3.connect(db_path, timeout=timeout)
+    try:
+        with connection:  # Commits or rollbacks
+            yield connection
+    finally:
+        connection.close()
@@ -0,0 +1,338 @@
+__author__ = 'kranonetka'
+
+from abc import ABC, abstractmethod
+
+from sqlalchemy import select, bindparam
+from sqlalchemy.dialects.sqlite import insert
+
+from ._db import DBContext, DutyRooms, SyncTable, LastRequests, Admins, Settings, Subscriptions, RoomSets, \
+    SyncHistory
+
+if False:  # Type hinting
+    import datetime  # noqa
+    from sqlalchemy.engine import Connection  # noqa
+    from sqlalchemy.orm import Session  # noqa
+    from typing import Callable, Dict, List, Optional, Sequence, Tuple  # noqa
+
+# Hot reads go through Core, no ORM objects are built for them
+SELECT_DUTY_ROOMS = select(DutyRooms.room).order_by(DutyRooms.room)
+SELECT_SYNC = select(SyncTable.date, SyncTable.left_room, SyncTable.right_room).limit(1)
+SELECT_ADMINS = select(Admins.admin_id, Admins.name)
+SELECT_LAST_REQUESTS = select(LastRequests.peer_id, LastRequests.request_date)
+SELECT_SETTING = select(Settings.value).where(Settings.key == bindparam('key'))
+SELECT_SUBSCRIBERS = select(Subscriptions.peer_id).order_by(Subscriptions.peer_id)
+SELECT_SYNC_HISTORY = select(SyncHistory.date, SyncHistory.left_room, SyncHistory.right_room, SyncHistory.rooms_version) \
+    .order_by(SyncHistory.id)
+SELECT_ROOM_SETS = select(RoomSets.version, RoomSets.rooms)
+SELECT_LATEST_ROOM_SET = select(RoomSets.version, RoomSets.rooms).order_by(RoomSets.version.desc()).limit(1)
+
+
+class Storage(ABC):
+    """
+    Persistent state of one bot: duty rooms, sync point and its history, admins, notification timeouts,
+    subscriptions and settings. Every method is one transaction
+    """
+
+    @abstractmethod
+    def seed_if_empty(self, rooms, admin_id, split_rooms, today):
+        """
+        Fill fresh storage: all rooms on duty, one admin and sync point at the first room of each side
+
+        :type rooms: Sequence[int]
+        :type admin_id: int
+        :param split_rooms: Callable[[Sequence[int]], Tuple[Tuple[int, ...], Tuple[int, ...]]] -- rooms by side
+        :type today: datetime.date
+        """
+
+    @abstractmethod
+    def load_rotation(self):  # type: () -> Tuple[Tuple[int, ...], Tuple[datetime.date, int, int]]
+        """
+        Sorted duty rooms and sync point (date, left room, right room)
+        """
+
+    @abstractmethod
+    def add_rooms(self, rooms):  # type: (Sequence[int]) -> None
+        pass
+
+    @abstractmethod
+    def remove_rooms(self, rooms):  # type: (Sequence[int]) -> None
+        pass
+
+    @abstractmethod
+    def set_sync(self, date, left_room, right_room):  # type: (datetime.date, int, int) -> None
+        pass
+
+    @abstractmethod
+    def load_sync_history(self):
+        """
+        Sync points in order they were added and room sets they refer to
+
+        :rtype: Tuple[List[Tuple[datetime.date, int, int, int]], Dict[int, Tuple[int, ...]]]
+        :return: points (date, left room, right room, room set version), sorted rooms by room set version
+        """
+
+    @abstractmethod
+    def append_sync_point(self, date, left_room, right_room, rooms):
+        """
+        Add point to sync history. Rooms get new room set version unless equal to the latest one
+
+        :type date: datetime.date
+        :type left_room: int
+        :type right_room: int
+        :type rooms: Sequence[int]
+        :return: int -- room set version of the point
+        """
+
+    @abstractmethod
+    def update_rotation(self, date, left_room, right_room, added_rooms=(), removed_rooms=()):
+        """
+        One admin's change of rotation in one transaction: rooms are added and removed, sync point is set
+        and appended to sync history with the resulting rooms, rotation version is bumped
+
+        :type date: datetime.date
+        :type left_room: int
+        :type right_room: int
+        :type added_rooms: Sequence[int]
+        :type removed_rooms: Sequence[int]
+        :return: int -- new rotation version
+        """
+
+    @abstractmethod
+    def load_admins(self):  # type: () -> Tuple[int, Dict[int, Optional[str]]]
+        """
+        Admins version and names of admins by id
+        """
+
+    @abstractmethod
+    def add_admins(self, names):  # type: (Dict[int, Optional[str]]) -> int
+        """
+        :return: new admins version
+        """
+
+    @abstractmethod
+    def remove_admins(self, admin_ids):  # type: (Sequence[int]) -> int
+        """
+        :return: new admins version
+        """
+
+    @abstractmethod
+    def set_admin_names(self, names):  # type: (Dict[int, str]) -> None
+        pass
+
+    @abstractmethod
+    def load_last_requests(self):  # type: () -> Dict[int, datetime.datetime]
+        pass
+
+    @abstractmethod
+    def save_last_requests(self, last_requests, expired_before):
+        """
+        :param last_requests: Dict[int, Optional[datetime.datetime]] -- changed ones, None -- removed
+        :param expired_before: datetime.datetime -- older ones are dropped
+        """
+
+    @abstractmethod
+    def get_setting(self, key):  # type: (str) -> Optional[str]
+        pass
+
+    @abstractmethod
+    def set_setting(self, key, value):  # type: (str, Optional[str]) -> None
+        pass
+
+    @abstractmethod
+    def claim_setting(self, key, value):  # type: (str, str) -> bool
+        """
+        Set setting unless it already has the value. True if it was changed
+        """
+
+    @abstractmethod
+    def subscribe(self, peer_id):  # type: (int) -> bool
+        """
+        :return: False if already subscribed
+        """
+
+    @abstractmethod
+    def unsubscribe(self, peer_id):  # type: (int) -> bool
+        """
+        :return: False if was not subscribed
+        """
+
+    @abstractmethod
+    def load_subscriptions(self):  # type: () -> List[int]
+        pass
+
+    def close(self):  # type: () -> None
+        pass
+
+
+class SqlStorage(Storage):
+    """
+    Tables of DBContext: writes through ORM sessions, reads through Core.
+    Several processes may share the database file
+    """
+
+    def __init__(self, context_name, **db_options):  # type: (str, object) -> None
+        """
+        :param db_options: passed to DBContext
+        """
+        self._db_context = DBContext(context_name, **db_options)
+
+    def seed_if_empty(self, rooms, admin_id, split_rooms, today):
+        with self._db_context.session() as session:  # type: Session
+            if session.query(DutyRooms).first() is None:
+                session.add_all(DutyRooms(room=room) for room in rooms)
+            if session.query(Admins).first() is None:
+                session.add(Admins(admin_id=admin_id))
+            if session.query(SyncTable).first() is None:
+                left_rooms, right_rooms = split_rooms(tuple(session.execute(SELECT_DUTY_ROOMS).scalars()))
+                session.add(SyncTable(id=0, date=today, left_room=left_rooms[0], right_room=right_rooms[0]))
+
+    def load_rotation(self):  # type: () -> Tuple[Tuple[int, ...], Tuple[datetime.date, int, int]]
+        with self._db_context.read() as connection:  # type: Connection
+            rooms = tuple(connection.execute(SELECT_DUTY_ROOMS).scalars())
+            sync = tuple(connection.execute(SELECT_SYNC).one())
+        return rooms, sync
+
+    def add_rooms(self, rooms):  # type: (Sequence[int]) -> None
+        with self._db_context.session() as session:  # type: Session
+            session.add_all(DutyRooms(room=room) for room in rooms)
+
+    def remove_rooms(self, rooms):  # type: (Sequence[int]) -> None
+        with self._db_context.session() as session:  # type: Session
+            session.query(DutyRooms). \
+                filter(DutyRooms.room.in_(rooms)). \
+                delete(synchronize_session=False)
+
+    def set_sync(self, date, left_room, right_room):  # type: (datetime.date, int, int) -> None
+        with self._db_context.session() as session:  # type: Session
+            session.merge(SyncTable(id=0, date=date, left_room=left_room, right_room=right_room))
+
+    def load_sync_history(self):
+        # type: () -> Tuple[List[Tuple[datetime.date, int, int, int]], Dict[int, Tuple[int, ...]]]
+        with self._db_context.read() as connection:  # type: Connection
+            points = [tuple(point) for point in connection.execute(SELECT_SYNC_HISTORY)]
+            room_sets = {version: _parse_rooms(rooms) for version, rooms in connection.execute(SELECT_ROOM_SETS)}
+        return points, room_sets
+
+    def append_sync_point(self, date, left_room, right_room, rooms):
+        # type: (datetime.date, int, int, Sequence[int]) -> int
+        with self._db_context.session() as session:  # type: Session
+            return self._append_sync_point(session, date, left_room, right_room, rooms)
+
+    def update_rotation(self, date, left_room, right_room, added_rooms=(), removed_rooms=()):
+        # type: (datetime.date, int, int, Sequence[int], Sequence[int]) -> int
+        with self._db_context.session() as session:  # type: Session
+            if removed_rooms:
+                session.query(DutyRooms). \
+                    filter(DutyRooms.room.in_(removed_rooms)). \
+                    delete(synchronize_session=False)
+            session.add_all(DutyRooms(room=room) for room in added_rooms)
+            session.merge(SyncTable(id=0, date=date, left_room=left_room, right_room=right_room))
+            session.flush()
+            rooms = session.execute(SELECT_DUTY_ROOMS).scalars().all()
+            self._append_sync_point(session, date, left_room, right_room, rooms)
+            return self._bump_version(session, 'rotation_version')
+
+    @staticmethod
+    def _append_sync_point(session, date, left_room, right_room, rooms):
+        # type: (Session, datetime.date, int, int, Sequence[int]) -> int
+        rooms = ','.join(map(str, sorted(rooms)))
+        latest = session.execute(SELECT_LATEST_ROOM_SET).first()
+        if latest is not None and latest.rooms == rooms:
+            version = latest.version
+        else:
+            version = latest.version + 1 if latest is not None else 1
+            session.add(RoomSets(version=version, rooms=rooms))
+        session.add(SyncHistory(date=date, left_room=left_room, right_room=right_room, rooms_version=version))
+        return version
+
+    def load_admins(self):  # type: () -> Tuple[int, Dict[int, Optional[str]]]
+        with self._db_context.read() as connection:  # type: Connection
+            version = int(connection.execute(SELECT_SETTING, dict(key='admins_version')).scalar() or 0)
+            admin_names = dict(connection.execute(SELECT_ADMINS).all())
+        return version, admin_names
+
+    def add_admins(self, names):  # type: (Dict[int, Optional[str]]) -> int
+        with self._db_context.session() as session:  # type: Session
+            session.add_all(Admins(admin_id=admin_id, name=name) for admin_id, name in names.items())
+            return self._bump_version(session, 'admins_version')
+
+    def remove_admins(self, admin_ids):  # type: (Sequence[int]) -> int
+        with self._db_context.session() as session:  # type: Session
+            session.query(Admins). \
+                filter(Admins.admin_id.in_(admin_ids)). \
+                delete(synchronize_session=False)
+            return self._bump_version(session, 'admins_version')
+
+    def set_admin_names(self, names):  # type: (Dict[int, str]) -> None
+        with self._db_context.session() as session:  # type: Session
+            for admin_id, name in names.items():
+                session.query(Admins). \
+                    filter(Admins.admin_id == admin_id). \
+                    update({Admins.name: name}, synchronize_session=False)
+
+    @staticmethod
+    def _bump_version(session, key):  # type: (Session, str) -> int
+        setting = session.get(Settings, key)  # type: Optional[Settings]
+        version = int(setting.value) + 1 if setting is not None and setting.value else 1
+        session.merge(Settings(key=key, value=str(version)))
+        return version
+
+    def load_last_requests(self):  # type: () -> Dict[int, datetime.datetime]
+        with self._db_context.read() as connection:  # type: Connection
+            return dict(connection.execute(SELECT_LAST_REQUESTS).all())
+
+    def save_last_requests(self, last_requests, expired_before):
+        # type: (Dict[int, Optional[datetime.datetime]], datetime.datetime) -> None
+        with self._db_context.session() as session:  # type: Session
+            for peer_id, request_date in last_requests.items():
+                if request_date is None:
+                    session.query(LastRequests). \
+                        filter(LastRequests.peer_id == peer_id). \
+                        delete(synchronize_session=False)
+                else:
+                    session.merge(LastRequests(peer_id=peer_id, request_date=request_date))
+            session.query(LastRequests). \
+                filter(LastRequests.request_date < expired_before). \
+                delete(synchronize_session=False)
+
+    def get_setting(self, key):  # type: (str) -> Optional[str]
+        with self._db_context.read() as connection:  # type: Connection
+            return connection.execute(SELECT_SETTING, dict(key=key)).scalar()
+
+    def set_setting(self, key, value):  # type: (str, Optional[str]) -> None
+        with self._db_context.session() as session:  # type: Session
+            session.merge(Settings(key=key, value=value))
+
+    def claim_setting(self, key, value):  # type: (str, str) -> bool
+        with self._db_context.session() as session:  # type: Session
+            return bool(session.execute(
+                insert(Settings).values(key=key, value=value).on_conflict_do_update(
+                    index_elements=[Settings.key],
+                    set_=dict(value=value),
+                    where=Settings.value.is_distinct_from(value)
+                )
+            ).rowcount)
+
+    def subscribe(self, peer_id):  # type: (int) -> bool
+        with self._db_context.session() as session:  # type: Session
+            if session.get(Subscriptions, peer_id) is not None:
+                return False
+            session.add(Subscriptions(peer_id=peer_id))
+            return True
+
+    def unsubscribe(self, peer_id):  # type: (int) -> bool
+        with self._db_context.session() as session:  # type: Session
+            return bool(session.query(Subscriptions).
+                        filter(Subscriptions.peer_id == peer_id).
+                        delete(synchronize_session=False))
+
+    def load_subscriptions(self):  # type: () -> List[int]
+        with self._db_context.read() as connection:  # type: Connection
+            return list(connection.execute(SELECT_SUBSCRIBERS).scalars())
+
+    def close(self):  # type: () -> None
+        self._db_context.close()
+
+
+def _parse_rooms(rooms):  # type: (str) -> Tuple[int, ...]
+    return tuple(map(int, rooms.split(','))) if rooms else ()
@@ -1,10 +1,26 @@
 __author__ = 'kranonetka'
 
+if False:  # Type hinting
+    from typing import Optional  # noqa
+
 
 class Mention:
-    def __init__(self, type, id):  # type: (str, int) -> None
+    def __init__(self, type, id, alias=None):  # type: (str, int, Optional[str]) -> None
+        """
+        :param alias: text shown in place of mention, usually user's name
+        """
         self.type = type
         self.id = id
+        self.alias = alias
+
+    @property
+    def name(self):  # type: () -> Optional[str]
+        """
+        Alias if it is a name, None for empty alias and handles like `@id1`
+        """
+        if self.alias and not self.alias.startswith('@'):
+            return self.alias
+        return None
 
     def __str__(self):
         return f'{self.__class__.__name__}({self.type}{self.id})'
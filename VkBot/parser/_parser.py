@@ -1,22 +1,119 @@
 __author__ = 'kranonetka'
 
+import threading
+from collections import OrderedDict
+
+from parsimonious import ParseError
 from parsimonious.nodes import Node, NodeVisitor
 
+from .._metrics import PARSE_SECONDS, PARSE_FAILURES
 from ._grammar import message_grammar
 from ._mention import Mention
 from ._message import Message
+from ._prefilter import CommandPrefilter
 from .commands import RemoveRoomsCommand, AddRoomsCommand, ShowListCommand, NotifyTodayCommand, \
-    GetDutyDateCommand, HelpCommand, SetRoomsCommand, AddAdmins, RemoveAdmins
+    GetDutyDateCommand, HelpCommand, SetRoomsCommand, AddAdmins, RemoveAdmins, ShowScheduleCommand, \
+    SubscribeCommand, UnsubscribeCommand, PastDutyCommand
+
+if False:  # Type hinting
+    from typing import Optional  # noqa
+
+WEEK_DAYS = 7
+MONTH_DAYS = 30
+
+MONTH_NUMBERS = {
+    'января': 1,
+    'февраля': 2,
+    'марта': 3,
+    'апреля': 4,
+    'мая': 5,
+    'июня': 6,
+    'июля': 7,
+    'августа': 8,
+    'сентября': 9,
+    'октября': 10,
+    'ноября': 11,
+    'декабря': 12
+}
 
 
 class MessageParser(NodeVisitor):
     grammar = message_grammar
+    prefilter = CommandPrefilter(message_grammar)
+
+    def __init__(self, cache_size=0):  # type: (int) -> None
+        """
+        :param cache_size: how many parsed messages to keep by their text, lowered unless it has a mention;
+            0 -- no caching. Parsed messages are shared between callers and must not be modified
+        """
+        self._cache_size = cache_size
+        self._cache = OrderedDict()  # type: OrderedDict[str, Message]
+        self._cache_lock = threading.Lock()
+        self._cache_hits = 0
+        self._cache_misses = 0
+        self._local = threading.local()  # Text being parsed in original case
 
     def parse(self, text, pos=0):
         """
+        Commands are matched case-insensitively, mention aliases keep original case
         :rtype: Message
         """
-        return super(MessageParser, self).parse(text.lower(), pos)
+        if not self._cache_size or pos:
+            return self._parse_text(text, pos)
+
+        # Case matters only for mention aliases, other texts share the slot of their lowered form
+        key = text if '[' in text else text.lower()
+        with self._cache_lock:
+            message = self._cache.get(key)
+            if message is not None:
+                self._cache.move_to_end(key)
+                self._cache_hits += 1
+                return message
+            self._cache_misses += 1
+
+        message = self._parse_text(text)
+
+        with self._cache_lock:
+            self._cache[key] = message
+            if len(self._cache) > self._cache_size:
+                self._cache.popitem(last=False)
+        return message
+
+    def _parse_text(self, text, pos=0):  # type: (str, int) -> Message
+        lowered = text.lower()
+        # Node positions of lowered text are used to slice the original one, so lengths must match
+        self._local.text = text if len(text) == len(lowered) else lowered
+        with PARSE_SECONDS.time():
+            try:
+                return super(MessageParser, self).parse(lowered, pos)
+            except ParseError:
+                PARSE_FAILURES.inc()
+                raise
+            finally:
+                self._local.text = None
+
+    def _original_text(self, node):  # type: (Node) -> str
+        return self._local.text[node.start:node.end]
+
+    def cache_info(self):  # type: () -> dict
+        return dict(
+            hits=self._cache_hits,
+            misses=self._cache_misses,
+            size=len(self._cache),
+            max_size=self._cache_size
+        )
+
+    def try_parse(self, text):  # type: (str) -> Optional[Message]
+        """
+        Parse message if it is a command, None otherwise.
+        Ordinary chat messages are rejected by prefilter without running the parser
+        """
+        if not self.prefilter.may_be_command(text):
+            return None
+        try:
+            return self.parse(text)
+        except ParseError:
+            return None
 
     def visit_message(self, node: Node, visited_children: list):
         message = Message(visited_children[2])
@@ -32,7 +129,8 @@ class MessageParser(NodeVisitor):
     def visit_mention(self, node: Node, visited_children: list):
         return Mention(
             type=node.children[1].text,
-            id=visited_children[2]
+            id=visited_children[2],
+            alias=self._original_text(node.children[4])
         )
 
     def visit_id(self, node: Node, visited_children: list):
@@ -49,24 +147,24 @@ class MessageParser(NodeVisitor):
         return mentions
 
     def visit_add_admins(self, node: Node, visited_children: list):
-        user_ids = []
+        users = []
 
         mentions = visited_children[2]
         for mention in mentions:  # type: Mention
             if mention.type == 'id':
-                user_ids.append(mention.id)
+                users.append(mention)
 
-        return AddAdmins(user_ids)
+        return AddAdmins(users)
 
     def visit_remove_admins(self, node: Node, visited_children: list):
-        user_ids = []
+        users = []
 
         mentions = visited_children[2]
         for mention in mentions:  # type: Mention
             if mention.type == 'id':
-                user_ids.append(mention.id)
+                users.append(mention)
 
-        return RemoveAdmins(user_ids)
+        return RemoveAdmins(users)
 
     def visit_show_list(self, node: Node, visited_children: list):
         return ShowListCommand()
@@ -74,6 +172,52 @@ class MessageParser(NodeVisitor):
     def visit_notify_today(self, node: Node, visited_children: list):
         return NotifyTodayCommand()
 
+    def visit_schedule(self, node: Node, visited_children: list):
+        if not isinstance(period := visited_children[1], Node):  # If period specified
+            return ShowScheduleCommand(period[0][1])
+        return ShowScheduleCommand(WEEK_DAYS)
+
+    def visit_past_duty(self, node: Node, visited_children: list):
+        return PastDutyCommand(*visited_children[-1])
+
+    def visit_date(self, node: Node, visited_children: list):
+        return visited_children[0]
+
+    def visit_numeric_date(self, node: Node, visited_children: list):
+        day, _, month, year = visited_children
+        if not isinstance(year, Node):  # If year specified
+            return day, month, year[0][1]
+        return day, month, None
+
+    visit_verbal_date = visit_numeric_date  # Same children: day, delimiter, month, optional year
+
+    def visit_day(self, node: Node, visited_children: list):
+        return int(node.text)
+
+    def visit_month_number(self, node: Node, visited_children: list):
+        return int(node.text)
+
+    def visit_year(self, node: Node, visited_children: list):
+        return int(node.text)
+
+    def visit_month_name(self, node: Node, visited_children: list):
+        return MONTH_NUMBERS[node.text]
+
+    def visit_subscribe(self, node: Node, visited_children: list):
+        return SubscribeCommand()
+
+    def visit_unsubscribe(self, node: Node, visited_children: list):
+        return UnsubscribeCommand()
+
+    def visit_schedule_period(self, node: Node, visited_children: list):
+        return visited_children[0]
+
+    def visit_month(self, node: Node, visited_children: list):
+        return MONTH_DAYS
+
+    def visit_week(self, node: Node, visited_children: list):
+        return WEEK_DAYS
+
     def visit_add_rooms(self, node: Node, visited_children: list):
         return AddRoomsCommand(visited_children[-1])
 
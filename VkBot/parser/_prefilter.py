@@ -0,0 +1,60 @@
+__author__ = 'kranonetka'
+
+import re
+
+from parsimonious.expressions import Literal, OneOf, Regex, Sequence
+
+if False:  # Type hinting
+    from parsimonious import Grammar  # noqa
+    from parsimonious.expressions import Expression  # noqa
+    from typing import Tuple, List, Pattern  # noqa
+
+
+class CommandPrefilter:
+    """
+    Cheap first pass before the full parse: checks that the text, after optional leading mention,
+    starts the way one of grammar's commands does. Starting literals and regexes are collected
+    from the `command` rule, so the filter follows grammar changes. Never rejects a valid command.
+    """
+
+    def __init__(self, grammar):  # type: (Grammar) -> None
+        literals, patterns = [], []
+        self._collect_starters(grammar['command'], literals, patterns)
+
+        self._literals = tuple(dict.fromkeys(literals))  # type: Tuple[str, ...]
+        self._patterns = tuple(patterns)  # type: Tuple[Pattern, ...]
+        self._prefix_length = max(map(len, self._literals), default=1)
+
+    def may_be_command(self, text):  # type: (str) -> bool
+        pos = 0
+        if text.startswith('['):  # Mention
+            pos = text.find(']') + 1
+            if not pos:
+                return False
+            if text.startswith(',', pos):
+                pos += 1
+
+        while text[pos:pos + 1].isspace():
+            pos += 1
+
+        head = text[pos:pos + self._prefix_length].lower()
+        if head.startswith(self._literals):
+            return True
+        return any(pattern.match(head) for pattern in self._patterns)
+
+    @classmethod
+    def _collect_starters(cls, expression, literals, patterns):  # type: (Expression, List[str], List[Pattern]) -> None
+        if isinstance(expression, Literal) and expression.literal:
+            literals.append(expression.literal)
+        elif isinstance(expression, Regex):
+            patterns.append(expression.re)
+        elif isinstance(expression, OneOf):
+            for member in expression.members:
+                cls._collect_starters(member, literals, patterns)
+        elif isinstance(expression, Sequence):
+            cls._collect_starters(expression.members[0], literals, patterns)
+        else:  # Can match empty string or is unknown, nothing can be rejected safely
+            patterns.append(_ANYTHING)
+
+
+_ANYTHING = re.compile('')
@@ -4,7 +4,8 @@ from abc import ABC, abstractmethod
 
 if False:  # Type hinting
     from VkBot import Bot  # noqa
-    from typing import Any, Sequence  # noqa
+    from ._mention import Mention  # noqa
+    from typing import Any, Optional, Sequence  # noqa
 
 
 class Command(ABC):
@@ -22,6 +23,18 @@ class PrivilegedCommand(Command, ABC):
     pass
 
 
+class StatelessCommand(Command, ABC):
+    """
+    Command without arguments: the only instance of each subclass is shared by all messages
+    """
+    _instance = None
+
+    def __new__(cls):
+        if cls.__dict__.get('_instance') is None:
+            cls._instance = super(StatelessCommand, cls).__new__(cls)
+        return cls._instance
+
+
 class GetDutyDateCommand(Command):
     def __init__(self, room):
         """
@@ -38,12 +51,11 @@ class SetRoomsCommand(PrivilegedCommand):
         """
         :type rooms: Sequence[int]
         """
-        self._rooms = rooms
+        self._rooms = tuple(rooms)
 
     def perform(self, vkbot_instance, peer_id):  # type: (Bot, int) -> None
         today = vkbot_instance.get_today_date()
-        for room in self._rooms:
-            vkbot_instance.set_room(peer_id, room, today)
+        vkbot_instance.set_rooms(peer_id, self._rooms, today)
 
 
 class AddRoomsCommand(PrivilegedCommand):
@@ -51,7 +63,7 @@ class AddRoomsCommand(PrivilegedCommand):
         """
         :type rooms: Sequence[int]
         """
-        self._rooms = rooms
+        self._rooms = frozenset(rooms)
 
     def perform(self, vkbot_instance, peer_id):  # type: (Bot, int) -> None
         vkbot_instance.add_rooms(peer_id, self._rooms)
@@ -62,46 +74,82 @@ class RemoveRoomsCommand(PrivilegedCommand):
         """
         :type rooms: Sequence[int]
         """
-        self._rooms = rooms
+        self._rooms = frozenset(rooms)
 
     def perform(self, vkbot_instance, peer_id):  # type: (Bot, int) -> None
         vkbot_instance.remove_rooms(peer_id, self._rooms)
 
 
-class ShowListCommand(Command):
+class ShowListCommand(StatelessCommand):
     def perform(self, vkbot_instance, peer_id):  # type: (Bot, int) -> None
         vkbot_instance.show_list(peer_id)
 
 
-class NotifyTodayCommand(Command):
+class NotifyTodayCommand(StatelessCommand):
     def perform(self, vkbot_instance, peer_id):  # type: (Bot, int) -> None
         vkbot_instance.show_today_rooms(peer_id)
 
 
-class HelpCommand(Command):
+class ShowScheduleCommand(Command):
+    def __init__(self, days):
+        """
+        :type days: int
+        """
+        self._days = days
+
+    def perform(self, vkbot_instance, peer_id):  # type: (Bot, int) -> None
+        vkbot_instance.show_schedule(peer_id, self._days)
+
+
+class PastDutyCommand(Command):
+    def __init__(self, day, month, year=None):
+        """
+        :type day: int
+        :type month: int
+        :param year: Optional[int] -- None -- the latest such date not after today
+        """
+        self._day = day
+        self._month = month
+        self._year = year
+
+    def perform(self, vkbot_instance, peer_id):  # type: (Bot, int) -> None
+        vkbot_instance.show_past_duty(peer_id, self._day, self._month, self._year)
+
+
+class SubscribeCommand(StatelessCommand):
+    def perform(self, vkbot_instance, peer_id):  # type: (Bot, int) -> None
+        vkbot_instance.subscribe(peer_id)
+
+
+class UnsubscribeCommand(StatelessCommand):
+    def perform(self, vkbot_instance, peer_id):  # type: (Bot, int) -> None
+        vkbot_instance.unsubscribe(peer_id)
+
+
+class HelpCommand(StatelessCommand):
     def perform(self, vkbot_instance, peer_id):  # type: (Bot, int) -> None
         vkbot_instance.help(peer_id)
 
 
 class AddAdmins(PrivilegedCommand):
-    def __init__(self, user_ids):
+    def __init__(self, users):
         """
-        :type user_ids: Sequence[int]
+        :type users: Sequence[Mention]
         """
-        self._user_ids = user_ids
+        self._user_ids = tuple(user.id for user in users)
+        self._aliases = {user.id: user.name for user in users if user.name}
 
     def perform(self, vkbot_instance, peer_id):  # type: (Bot, int) -> None
-        for user_id in self._user_ids:
-            vkbot_instance.add_admin(peer_id, user_id)
+        vkbot_instance.add_admins(peer_id, self._user_ids, self._aliases)
 
 
 class RemoveAdmins(PrivilegedCommand):
-    def __init__(self, user_ids):
+    def __init__(self, users):
         """
-        :type user_ids: Sequence[int]
+        :type users: Sequence[Mention]
         """
-        self._user_ids = user_ids
+        self._user_ids = tuple(user.id for user in users)
+        self._aliases = {user.id: user.name for user in users if user.name}
 
     def perform(self, vkbot_instance, peer_id):  # type: (Bot, int) -> None
-        for user_id in self._user_ids:
-            vkbot_instance.remove_admin(peer_id, user_id)
+        vkbot_instance.remove_admins(peer_id, self._user_ids, self._aliases)
@@ -0,0 +1,49 @@
+"""
+Generated group chat traffic: mostly ordinary chatter with a share of bot commands
+"""
+
+__author__ = 'kranonetka'
+
+import random
+
+CHATTER = (
+    'Привет всем',
+    'кто-нибудь видел мою кружку на кухне?',
+    'Ребята, завтра в 10 собрание в холле',
+    'ок',
+    '+',
+    '))))',
+    'спасибо!',
+    'Кто дежурит на кухне? там опять гора посуды',
+    'https://vk.com/wall-12345_678',
+    '[id227725150|Антон], зайди в 612 пожалуйста',
+    'Когда уже починят душ на этаже...',
+    '601 и 620, вы сегодня мусор выносите?',
+    'список покупок скину в лс',
+    'помощь нужна с переездом, есть кто свободный в субботу?',
+    'А расписание пар на завтра кто-нибудь скинет?',
+    '🔥🔥🔥',
+    '-5 на улице, одевайтесь теплее',
+    'у кого есть зарядка type-c',
+    'лол',
+    'В 618 кто живёт? посылку принесли',
+)
+
+COMMANDS = (
+    'кто дежурит',
+    'Кто дежурит сегодня',
+    'помощь',
+    'список',
+    'когда 605',
+    'Когда 631',
+    'расписание',
+    '[club1|Дежурный], кто дежурит',
+)
+
+
+def generate_corpus(size, commands_share=0.1, seed=0):  # type: (int, float, int) -> list
+    rnd = random.Random(seed)
+    return [
+        rnd.choice(COMMANDS) if rnd.random() < commands_share else rnd.choice(CHATTER)
+        for _ in range(size)
+    ]
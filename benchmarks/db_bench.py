@@ -0,0 +1,83 @@
+"""
+Transactions per second of DBContext with SQLite defaults and with the performance profile.
+
+    python -m benchmarks.db_bench [--transactions N] [--threads N]
+"""
+
+__author__ = 'kranonetka'
+
+import argparse
+import datetime
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from sqlalchemy import select, bindparam
+
+from VkBot.db import DBContext, LastRequests, Settings
+
+SELECT_SETTING = select(Settings.value).where(Settings.key == bindparam('key'))
+
+
+def bench_writes(db_context, transactions, threads):  # type: (DBContext, int, int) -> float
+    def work(offset):
+        for peer_id in range(offset, transactions, threads):
+            with db_context.session() as session:
+                session.merge(LastRequests(peer_id=peer_id, request_date=datetime.datetime.now()))
+
+    return _run_threads(work, threads) / transactions
+
+
+def bench_orm_reads(db_context, transactions, threads):  # type: (DBContext, int, int) -> float
+    def work(offset):
+        for _ in range(offset, transactions, threads):
+            with db_context.session() as session:
+                setting = session.get(Settings, 'admins_version')
+                if setting is not None:
+                    setting.value  # noqa
+
+    return _run_threads(work, threads) / transactions
+
+
+def bench_core_reads(db_context, transactions, threads):  # type: (DBContext, int, int) -> float
+    def work(offset):
+        for _ in range(offset, transactions, threads):
+            with db_context.read() as connection:
+                connection.execute(SELECT_SETTING, dict(key='admins_version')).scalar()
+
+    return _run_threads(work, threads) / transactions
+
+
+def _run_threads(target, threads):  # type: (callable, int) -> float
+    workers = [threading.Thread(target=target, args=(offset,)) for offset in range(threads)]
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return time.perf_counter() - start
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument('--transactions', type=int, default=2000)
+    arg_parser.add_argument('--threads', type=int, default=4)
+    args = arg_parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for name, performance in (('default', False), ('performance', True)):
+            db_context = DBContext(str(Path(tmp_dir) / name), performance=performance)
+            with db_context.session() as session:
+                session.merge(Settings(key='admins_version', value='1'))
+
+            print(f'{name}:')
+            for bench_name, bench in (('writes', bench_writes),
+                                      ('ORM reads', bench_orm_reads),
+                                      ('Core reads', bench_core_reads)):
+                per_transaction = bench(db_context, args.transactions, args.threads)
+                print(f'  {bench_name:<12} {1 / per_transaction:10.0f} tx/s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,173 @@
+"""
+In-process stand-in for VK API: enough of groups.getById, groups.edit, users.get, messages.send
+and execute to run the bot offline, and Bots Long Poll server fed by `push_events`.
+Counts HTTP requests and API calls by method.
+"""
+
+__author__ = 'kranonetka'
+
+import json
+import re
+import threading
+import time
+from collections import Counter, deque
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import parse_qs, urlsplit
+
+EXECUTE_CALL_RE = re.compile(r'API\.([\w.]+)\(')
+LONG_POLL_KEY = 'fake-long-poll-key'
+
+
+class FakeVkApi:
+    def __init__(self, group_id, host='127.0.0.1', port=0, rps_limit=None, latency=0.0):
+        """
+        :type group_id: int
+        :type host: str
+        :type port: int
+        :param rps_limit: Optional[int] -- answer error 6 to requests over this many per second, as VK does
+        :param latency: float -- seconds every API request is delayed by, as round trip to real VK API
+        """
+        self.group_id = group_id
+        self.rps_limit = rps_limit
+        self.latency = latency
+        self.rejected = 0  # Requests answered with error 6
+        self._recent_requests = deque()  # Times of requests accepted during last second
+        self.requests = Counter()  # HTTP requests by method, `execute` counted once
+        self.calls = Counter()  # API calls by method, calls inside `execute` counted separately
+        self._lock = threading.Lock()
+        self._message_id = 0
+        self._events = []  # Long poll history, ts is index of the next event
+        self._events_added = threading.Condition(self._lock)
+
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'  # Keep-alive
+            disable_nagle_algorithm = True  # Headers and body are written separately
+
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length', 0))
+                values = {key: value[0] for key, value in parse_qs(self.rfile.read(length).decode('utf-8')).items()}
+                method = self.path.rsplit('/', 1)[-1]
+
+                body = json.dumps(fake.handle(method, values)).encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                url = urlsplit(self.path)
+                values = {key: value[0] for key, value in parse_qs(url.query).items()}
+
+                body = json.dumps(fake.check(values)).encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, name='FakeVkApi', daemon=True)
+
+    @property
+    def url(self):  # type: () -> str
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}/method/'
+
+    @property
+    def long_poll_url(self):  # type: () -> str
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}/long_poll'
+
+    @property
+    def long_poll_ts(self):  # type: () -> str
+        with self._lock:
+            return str(len(self._events))
+
+    def push_events(self, events):  # type: (list) -> None
+        with self._lock:
+            self._events.extend(events)
+            self._events_added.notify_all()
+
+    def check(self, values):  # type: (dict) -> dict
+        """
+        Long poll `a_check`: events after ts, waiting up to `wait` seconds for new ones
+        """
+        if values.get('key') != LONG_POLL_KEY:
+            return {'failed': 2}
+        ts = int(values.get('ts', 0))
+        with self._lock:
+            if ts > len(self._events):
+                return {'failed': 1, 'ts': str(len(self._events))}
+            self._events_added.wait_for(lambda: len(self._events) > ts, timeout=float(values.get('wait', 25)))
+            return {'ts': str(len(self._events)), 'updates': self._events[ts:]}
+
+    def start(self):  # type: () -> FakeVkApi
+        self._thread.start()
+        return self
+
+    def stop(self):  # type: () -> None
+        self._server.shutdown()
+        self._server.server_close()
+
+    def reset_counters(self):  # type: () -> None
+        with self._lock:
+            self.requests.clear()
+            self.calls.clear()
+            self.rejected = 0
+
+    def snapshot(self):  # type: () -> tuple
+        with self._lock:
+            return Counter(self.requests), Counter(self.calls)
+
+    def handle(self, method, values):  # type: (str, dict) -> dict
+        with self._lock:
+            self.requests[method] += 1
+            if self.rps_limit is not None:
+                now = time.monotonic()
+                while self._recent_requests and self._recent_requests[0] <= now - 1:
+                    self._recent_requests.popleft()
+                if len(self._recent_requests) >= self.rps_limit:
+                    self.rejected += 1
+                    return {'error': {'error_code': 6, 'error_msg': 'Too many requests per second'}}
+                self._recent_requests.append(now)
+
+        if self.latency:
+            time.sleep(self.latency)
+
+        if method != 'execute':
+            return {'response': self._call(method, values)}
+
+        code = values.get('code', '')
+        decoder = json.JSONDecoder()
+        results = []
+        for match in EXECUTE_CALL_RE.finditer(code):
+            inner_values, _ = decoder.raw_decode(code, match.end())
+            results.append(self._call(match.group(1), inner_values))
+        return {'response': results}
+
+    def _call(self, method, values):  # type: (str, dict) -> object
+        with self._lock:
+            self.calls[method] += 1
+
+        if method == 'groups.getLongPollServer':
+            return {'key': LONG_POLL_KEY, 'server': self.long_poll_url, 'ts': self.long_poll_ts}
+        if method == 'groups.getById':
+            return [{'id': self.group_id, 'name': 'Fake group'}]
+        if method == 'users.get':
+            user_ids = [user_id for user_id in str(values.get('user_ids', '')).split(',') if user_id]
+            return [
+                {'id': int(user_id), 'first_name': f'Имя{user_id}', 'last_name': f'Фамилия{user_id}'}
+                for user_id in user_ids
+            ]
+        if method == 'messages.send':
+            with self._lock:
+                self._message_id += 1
+                return self._message_id
+        return 1
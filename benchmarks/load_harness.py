@@ -0,0 +1,251 @@
+"""
+End-to-end load harness: serves flask_app.app against in-process fake VK API (benchmarks.fake_vk)
+and replays generated callback events through /6_6 at given rate.
+
+Reports p50/p99 latency and throughput of callback requests, DB transactions and VK API
+calls of the whole run, then DB transactions and VK API calls spent on each command.
+Latency is counted from the moment a request was scheduled, so a saturated server
+shows up as growing latency instead of a lower sending rate.
+
+    python -m benchmarks.load_harness [--rate 200] [--duration 10] [--workers 0]
+
+Must be run from repository root. Scratch storage `<group id>.sqlite` (`.journal` and `.snapshot`
+with STORAGE_BACKEND=journal) is created in working directory and removed afterwards.
+"""
+
+__author__ = 'kranonetka'
+
+import argparse
+import contextlib
+import io
+import itertools
+import json
+import logging
+import os
+import random
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import requests
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from werkzeug.serving import make_server
+
+from benchmarks.chat_corpus import generate_corpus, COMMANDS
+from benchmarks.fake_vk import FakeVkApi
+
+CALLBACK_SECRET = 'load-harness-secret'
+AUTHOR_ID = 227725150  # Default admin of fresh database
+FIRST_PEER_ID = 2000000001
+
+PROFILED_COMMANDS = COMMANDS + (
+    'Привет всем',  # Chatter, rejected before the parse
+    '-638',
+    '+638',
+    '601 620',
+    '+ [id100001|Имя Фамилия]',
+    '- [id100001|Имя Фамилия]',
+)
+
+
+class TransactionCounter:
+    """
+    Counts transactions begun on any SQLAlchemy engine
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.count = 0
+        event.listen(Engine, 'begin', self._on_begin)
+
+    def _on_begin(self, connection):
+        with self._lock:
+            self.count += 1
+
+
+class EventFactory:
+    def __init__(self, group_id, peers, seed=0):  # type: (int, int, int) -> None
+        self._group_id = group_id
+        self._peers = peers
+        self._random = random.Random(seed)
+        self._event_ids = itertools.count()
+
+    def message(self, text, peer_id=None, from_id=None):  # type: (str, int, int) -> dict
+        event_id = next(self._event_ids)
+        if peer_id is None:
+            peer_id = FIRST_PEER_ID + self._random.randrange(self._peers)
+        if from_id is None:
+            from_id = self._random.randrange(1, 10 ** 8)
+        return {
+            'type': 'message_new',
+            'group_id': self._group_id,
+            'event_id': f'load-{event_id}',
+            'secret': CALLBACK_SECRET,
+            'object': {
+                'message': {
+                    'id': event_id,
+                    'date': int(time.time()),
+                    'peer_id': peer_id,
+                    'from_id': from_id,
+                    'text': text
+                }
+            }
+        }
+
+
+def percentile(values, share):  # type: (list, float) -> float
+    ordered = sorted(values)
+    if not ordered:
+        return float('nan')
+    return ordered[min(len(ordered) - 1, int(share * len(ordered)))]
+
+
+def replay(url, events, rate, concurrency):  # type: (str, list, float, int) -> tuple
+    """
+    Post events at `rate` per second. Returns latencies in seconds, failed requests count and elapsed seconds
+    """
+    local = threading.local()
+    lock = threading.Lock()
+    latencies = []
+    failed = Counter()
+
+    def post(scheduled_at, callback_event):
+        if not hasattr(local, 'session'):
+            local.session = requests.Session()
+        try:
+            response = local.session.post(url, data=json.dumps(callback_event))
+            error = None if response.status_code == 200 else response.status_code
+        except requests.RequestException as e:
+            error = type(e).__name__
+        with lock:
+            latencies.append(time.perf_counter() - scheduled_at)
+            if error is not None:
+                failed[error] += 1
+
+    with ThreadPoolExecutor(concurrency) as executor:
+        start = time.perf_counter()
+        for idx, callback_event in enumerate(events):
+            scheduled_at = start + idx / rate
+            delay = scheduled_at - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            executor.submit(post, scheduled_at, callback_event)
+    return latencies, failed, time.perf_counter() - start
+
+
+def wait_dispatched(routes):
+    if routes.event_dispatcher is not None:
+        routes.event_dispatcher.join()
+
+
+def run(args):
+    fake_vk = FakeVkApi(args.group_id).start()
+
+    os.environ.update(
+        WEBHOOK_SECRET=os.environ.get('WEBHOOK_SECRET', 'load-harness'),
+        VK_API_URL=fake_vk.url,
+        VK_API_TOKEN='load-harness-token',
+        VK_GROUP_ID=str(args.group_id),
+        CONFIRMATION_TOKEN='load-harness-confirmation',
+        VK_CALLBACK_SECRET=CALLBACK_SECRET,
+        EVENT_WORKERS=str(args.workers),
+    )
+    os.environ.pop('VK_TENANTS_FILE', None)
+    os.environ.pop('EVENT_DEDUP_DB', None)
+
+    transactions = TransactionCounter()
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+
+    with contextlib.redirect_stdout(io.StringIO()):  # Callback route prints every event
+        from flask_app import app, bot_registry
+        from flask_app import routes
+
+        server = make_server('127.0.0.1', 0, app, threaded=True)
+        threading.Thread(target=server.serve_forever, name='LoadHarnessServer', daemon=True).start()
+        url = f'http://127.0.0.1:{server.server_port}/6_6'
+
+        bot_registry.get(args.group_id)  # Start-up calls and transactions are not part of the load
+        factory = EventFactory(args.group_id, args.peers, args.seed)
+        events = [factory.message(text) for text in generate_corpus(
+            int(args.rate * args.duration), args.commands_share, args.seed)]
+
+        fake_vk.reset_counters()
+        transactions_before = transactions.count
+        latencies, failed, elapsed = replay(url, events, args.rate, args.concurrency)
+        wait_dispatched(routes)
+        _, load_calls = fake_vk.snapshot()
+        load_transactions = transactions.count - transactions_before
+
+        profile = profile_commands(url, factory, fake_vk, transactions, routes)
+
+        server.shutdown()
+        for bot in bot_registry.loaded():
+            bot.close()
+    fake_vk.stop()
+
+    print(f'Events: {len(events)} at {args.rate:g}/s, {args.workers} event workers, '
+          f'{args.concurrency} client connections')
+    print(f'Throughput: {len(latencies) / elapsed:.1f} requests/s, failed: {dict(failed) or 0}')
+    print(f'Latency: p50 {percentile(latencies, 0.5) * 1000:.2f} ms, p99 {percentile(latencies, 0.99) * 1000:.2f} ms')
+    print(f'DB transactions: {load_transactions}')
+    print(f'VK API calls: {sum(load_calls.values())} {dict(load_calls)}')
+    print()
+    print(f'{"command":<32} {"DB tx":>6} {"HTTP":>5} {"calls":>6}  methods')
+    for text, (command_transactions, command_requests, command_calls) in profile.items():
+        print(f'{text:<32} {command_transactions:>6} {sum(command_requests.values()):>5} '
+              f'{sum(command_calls.values()):>6}  {dict(command_calls)}')
+
+
+def profile_commands(url, factory, fake_vk, transactions, routes):  # type: (...) -> dict
+    """
+    Send every profiled command once from admin to a peer not seen before, one at a time.
+    Commands are sent twice, second run is measured, so caches are as warm as under steady load
+    """
+    peer_ids = itertools.count(FIRST_PEER_ID + 10 ** 6)
+    session = requests.Session()
+    profile = {}
+    for measured in (False, True):
+        for text in PROFILED_COMMANDS:
+            requests_before, calls_before = fake_vk.snapshot()
+            transactions_before = transactions.count
+
+            session.post(url, data=json.dumps(factory.message(text, next(peer_ids), AUTHOR_ID)))
+            wait_dispatched(routes)
+
+            requests_after, calls_after = fake_vk.snapshot()
+            if measured:
+                profile[text] = (
+                    transactions.count - transactions_before,
+                    requests_after - requests_before,
+                    calls_after - calls_before
+                )
+    return profile
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument('--rate', type=float, default=200, help='events per second')
+    arg_parser.add_argument('--duration', type=float, default=10, help='seconds')
+    arg_parser.add_argument('--workers', type=int, default=0, help='EVENT_WORKERS of the app')
+    arg_parser.add_argument('--concurrency', type=int, default=16, help='client connections')
+    arg_parser.add_argument('--peers', type=int, default=50, help='distinct chats')
+    arg_parser.add_argument('--commands-share', type=float, default=0.1)
+    arg_parser.add_argument('--group-id', type=int, default=987654321, help='group id of scratch database')
+    arg_parser.add_argument('--seed', type=int, default=0)
+    args = arg_parser.parse_args()
+
+    for db_path in Path('.').glob(f'{args.group_id}.*'):
+        arg_parser.error(f'{db_path} already exists, choose another --group-id')
+
+    try:
+        run(args)
+    finally:
+        for path in Path('.').glob(f'{args.group_id}.*'):
+            path.unlink()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+"""
+Bots Long Poll runner against in-process fake VK API (benchmarks.fake_vk).
+
+Generated message events are pushed to the fake long poll server in two parts, each handled by
+its own LongPollRunner, the second one started as after restart. Reports handling throughput,
+VK API calls and checks that the second runner resumed from saved ts without repeating events.
+
+    python -m benchmarks.long_poll_harness [--events 2000] [--concurrency 4]
+
+Must be run from repository root. Scratch database `<group id>.sqlite` is created
+in working directory and removed afterwards.
+"""
+
+__author__ = 'kranonetka'
+
+import argparse
+import asyncio
+import time
+from datetime import timedelta
+from pathlib import Path
+
+from VkBot import Bot, MessageParser, EventHandler, LongPollRunner
+from benchmarks.chat_corpus import generate_corpus
+from benchmarks.fake_vk import FakeVkApi
+from benchmarks.load_harness import EventFactory
+
+
+async def handle_all(bot, parser, fake_vk, events, concurrency, while_stopped=False):
+    # type: (Bot, MessageParser, FakeVkApi, list, int, bool) -> tuple
+    """
+    Run a fresh runner until all pushed events are handled. Returns handled events count and seconds spent.
+    With `while_stopped` events are pushed before the runner is created, so they are only seen from saved ts
+    """
+    target_ts = str(int(fake_vk.long_poll_ts) + len(events))
+    if while_stopped:
+        fake_vk.push_events(events)
+
+    runner = LongPollRunner(
+        bot.create_long_poll(wait=1),
+        EventHandler(lambda group_id: bot if bot.is_bot_id(group_id) else None, parser),
+        concurrency=concurrency,
+        load_ts=bot.load_long_poll_ts,
+        save_ts=bot.save_long_poll_ts
+    )
+
+    start = time.perf_counter()
+    task = asyncio.create_task(runner.run())
+    if not while_stopped:
+        fake_vk.push_events(events)
+    while bot.load_long_poll_ts() != target_ts:
+        await asyncio.sleep(0.01)
+    elapsed = time.perf_counter() - start
+    runner.stop()
+    await task
+    return runner.handled, elapsed
+
+
+def run(args):
+    fake_vk = FakeVkApi(args.group_id, rps_limit=args.vk_rps_limit).start()
+    bot = Bot(
+        access_token='long-poll-harness-token',
+        today_notification_timeout=timedelta(minutes=10),
+        api_url=fake_vk.url,
+        group_id=args.group_id
+    )
+    parser = MessageParser(cache_size=256)
+    factory = EventFactory(args.group_id, args.peers, args.seed)
+    texts = generate_corpus(args.events, args.commands_share, args.seed)
+    events = [factory.message(text) for text in texts]
+    for event in events:
+        event.pop('secret')
+    first, second = events[:len(events) // 2], events[len(events) // 2:]
+
+    fake_vk.reset_counters()
+    handled_first, elapsed_first = asyncio.run(handle_all(bot, parser, fake_vk, first, args.concurrency))
+    handled_second, elapsed_second = asyncio.run(
+        handle_all(bot, parser, fake_vk, second, args.concurrency, while_stopped=True))
+    _, calls = fake_vk.snapshot()
+    fake_vk.stop()
+
+    handled = handled_first + handled_second
+    print(f'Events: {len(events)}, {args.concurrency} handler threads')
+    print(f'Throughput: {handled / (elapsed_first + elapsed_second):.1f} events/s')
+    print(f'VK API calls: {sum(calls.values())} {dict(calls)}, rejected with error 6: {fake_vk.rejected}')
+    print(f'Resumed after restart: handled {handled_first} + {handled_second}, '
+          f'{"ok" if (handled_first, handled_second) == (len(first), len(second)) else "MISMATCH"}')
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument('--events', type=int, default=2000)
+    arg_parser.add_argument('--concurrency', type=int, default=4, help='handler threads')
+    arg_parser.add_argument('--peers', type=int, default=50, help='distinct chats')
+    arg_parser.add_argument('--commands-share', type=float, default=0.1)
+    arg_parser.add_argument('--group-id', type=int, default=987654322, help='group id of scratch database')
+    arg_parser.add_argument('--seed', type=int, default=0)
+    arg_parser.add_argument('--vk-rps-limit', type=int, default=None, help='fake VK answers error 6 over it')
+    args = arg_parser.parse_args()
+
+    db_path = Path(f'{args.group_id}.sqlite')
+    if db_path.exists():
+        arg_parser.error(f'{db_path} already exists, choose another --group-id')
+
+    try:
+        run(args)
+    finally:
+        for path in Path('.').glob(f'{args.group_id}.sqlite*'):
+            path.unlink()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,164 @@
+"""
+MessageParser benchmark: throughput and peak allocated memory per input case,
+compared with stored baseline to catch regressions of message.grammar or visitor methods.
+
+    python -m benchmarks.parser_bench                  # compare with baseline
+    python -m benchmarks.parser_bench --save-baseline  # store current results as baseline
+"""
+
+__author__ = 'kranonetka'
+
+import argparse
+import json
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+from parsimonious import ParseError
+
+from VkBot import MessageParser
+
+BASELINE_PATH = Path(__file__).parent / 'parser_baseline.json'
+
+
+def _mentions(count):  # type: (int) -> str
+    return ' '.join(f'[id{100000 + idx}|Имя{idx} Фамилия{idx}]' for idx in range(count))
+
+
+CASES = {
+    # Every command type
+    'get_duty_date': 'когда 605',
+    'set_rooms': '601 620',
+    'add_rooms': '+601 603-606',
+    'remove_rooms': '-601 603-606',
+    'show_list': 'список',
+    'help': 'помощь',
+    'notify_today': 'кто дежурит сегодня',
+    'schedule': 'расписание на месяц',
+    'add_admins': '+ [id227725150|Антон Антонов]',
+    'remove_admins': '- [id227725150|Антон Антонов]',
+    'mentioned_command': '[club123456|Дежурный], кто дежурит',
+    # Large room sets
+    'large_room_ranges': '+601-619 620-638',
+    'many_single_rooms': '+' + ' '.join(map(str, range(601, 639))),
+    'many_set_rooms': ', '.join(map(str, range(601, 639))),
+    # Long multi-mention admin commands
+    'mentions_10': '+ ' + _mentions(10),
+    'mentions_50': '+ ' + _mentions(50),
+    # Pathological inputs
+    'long_digit_run': '1' * 2000,
+    'long_digit_run_tail': '1' * 2000 + 'x',
+    'deep_separators': '601' + ' ,  ' * 500 + '602',
+    'separators_no_tail': '601' + ' , ' * 500,
+    'unclosed_mention': '[id1|' + 'a' * 2000,
+    # Non-matching chatter
+    'chatter_short': 'привет',
+    'chatter_long': 'Ребята, кто-нибудь видел мою кружку на кухне? ' * 10,
+    'chatter_command_like': 'кто дежурит на кухне? там опять гора посуды',
+}
+
+
+def parse(parser, text):  # type: (MessageParser, str) -> None
+    try:
+        parser.parse(text)
+    except ParseError:
+        pass
+
+
+def measure_throughput(parser, text, min_time, repeat=5):  # type: (MessageParser, str, float, int) -> float
+    """
+    Best of `repeat` runs, each at least `min_time` seconds long
+    """
+    best = 0.0
+    for _ in range(repeat):
+        iterations = 0
+        start = time.perf_counter()
+        elapsed = 0.0
+        while elapsed < min_time:
+            for _ in range(10):
+                parse(parser, text)
+            iterations += 10
+            elapsed = time.perf_counter() - start
+        best = max(best, iterations / elapsed)
+    return best
+
+
+def measure_allocations(parser, text):  # type: (MessageParser, str) -> int
+    """
+    Peak memory in bytes allocated while parsing text once
+    """
+    parse(parser, text)  # Warm up caches of the grammar
+    tracemalloc.start()
+    try:
+        tracemalloc.reset_peak()
+        start, _ = tracemalloc.get_traced_memory()
+        parse(parser, text)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak - start
+
+
+def run(min_time):  # type: (float) -> dict
+    parser = MessageParser()
+    return {
+        name: dict(
+            ops_per_sec=round(measure_throughput(parser, text, min_time), 1),
+            peak_bytes=measure_allocations(parser, text)
+        )
+        for name, text in CASES.items()
+    }
+
+
+def compare(results, baseline, tolerance, memory_tolerance):  # type: (dict, dict, float, float) -> bool
+    ok = True
+    print(f'{"case":<22} {"ops/s":>10} {"base":>10} {"peak KiB":>9} {"base":>9}')
+    for name, result in results.items():
+        base = baseline.get(name)
+        marks = []
+        if base is not None:
+            if result['ops_per_sec'] < base['ops_per_sec'] * (1 - tolerance):
+                marks.append('SLOWER')
+            if result['peak_bytes'] > base['peak_bytes'] * (1 + memory_tolerance):
+                marks.append('MORE MEMORY')
+        ok = ok and not marks
+        print('{:<22} {:>10.0f} {:>10} {:>9.1f} {:>9} {}'.format(
+            name,
+            result['ops_per_sec'],
+            '-' if base is None else f'{base["ops_per_sec"]:.0f}',
+            result['peak_bytes'] / 1024,
+            '-' if base is None else f'{base["peak_bytes"] / 1024:.1f}',
+            ' '.join(marks)
+        ))
+    return ok
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument('--save-baseline', action='store_true')
+    arg_parser.add_argument('--min-time', type=float, default=0.1, help='seconds of each of 5 runs of a case')
+    arg_parser.add_argument('--tolerance', type=float, default=0.25, help='allowed relative throughput drop')
+    arg_parser.add_argument('--memory-tolerance', type=float, default=0.05, help='allowed relative memory growth')
+    args = arg_parser.parse_args()
+
+    results = run(args.min_time)
+
+    if args.save_baseline:
+        with BASELINE_PATH.open('w', encoding='utf-8') as fp:
+            json.dump(results, fp, indent=2, sort_keys=True)
+            fp.write('\n')
+        print(f'Baseline saved to {BASELINE_PATH}')
+        return
+
+    baseline = {}
+    if BASELINE_PATH.exists():
+        with BASELINE_PATH.open('r', encoding='utf-8') as fp:
+            baseline = json.load(fp)
+
+    if not compare(results, baseline, args.tolerance, args.memory_tolerance):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+"""
+Cost of rejecting ordinary chat messages: full parse that fails with ParseError vs CommandPrefilter.
+
+    python -m benchmarks.prefilter_bench [--messages N]
+"""
+
+__author__ = 'kranonetka'
+
+import argparse
+import time
+
+from parsimonious import ParseError
+
+from VkBot import MessageParser
+from benchmarks.chat_corpus import generate_corpus
+
+
+def parse_all(parser, corpus):  # type: (MessageParser, list) -> int
+    parsed = 0
+    for text in corpus:
+        try:
+            parser.parse(text)
+        except ParseError:
+            continue
+        parsed += 1
+    return parsed
+
+
+def try_parse_all(parser, corpus):  # type: (MessageParser, list) -> int
+    return sum(parser.try_parse(text) is not None for text in corpus)
+
+
+def measure(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument('--messages', type=int, default=20000)
+    args = arg_parser.parse_args()
+
+    parser = MessageParser()
+    corpus = generate_corpus(args.messages)
+    chatter = [text for text in corpus if not parser.prefilter.may_be_command(text)]
+
+    parsed, parse_time = measure(parse_all, parser, corpus)
+    try_parsed, try_parse_time = measure(try_parse_all, parser, corpus)
+    assert parsed == try_parsed, 'Prefilter rejected a command'
+
+    _, reject_parse_time = measure(parse_all, parser, chatter)
+    _, reject_filter_time = measure(try_parse_all, parser, chatter)
+
+    print(f'{len(corpus)} messages, {parsed} commands, {len(chatter)} rejected by prefilter')
+    print(f'mixed corpus:  parse {parse_time / len(corpus) * 1e6:8.2f} us/msg, '
+          f'try_parse {try_parse_time / len(corpus) * 1e6:8.2f} us/msg')
+    print(f'reject path:   parse {reject_parse_time / len(chatter) * 1e6:8.2f} us/msg, '
+          f'prefilter {reject_filter_time / len(chatter) * 1e6:8.2f} us/msg')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,141 @@
+"""
+Start-up benchmark: time from `import flask_app` to the answer of the first callback event, with eager
+and lazy start-up (LAZY_STARTUP), against in-process fake VK API (benchmarks.fake_vk) delayed by
+--vk-latency per request.
+
+Each run is a fresh interpreter. Cold runs start without databases and cached group id,
+warm runs reuse those left by the previous run. Group id is resolved by token (VK_GROUP_ID unset).
+
+    python -m benchmarks.startup_bench [--vk-latency 0.1] [--repeat 3]
+
+Must be run from repository root. Scratch databases `<group id>.sqlite` and `group_ids.sqlite`
+are created in working directory and removed afterwards.
+"""
+
+__author__ = 'kranonetka'
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+from benchmarks.fake_vk import FakeVkApi
+from benchmarks.load_harness import CALLBACK_SECRET, FIRST_PEER_ID, EventFactory
+
+GROUP_IDS_DB = 'group_ids.sqlite'
+
+
+def child():
+    """
+    Runs in benchmarked interpreter, prints timings as JSON
+    """
+    group_id = int(os.environ['STARTUP_BENCH_GROUP_ID'])
+
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):  # Callback route prints every event
+        from flask_app import app, bot_registry
+        import_done = time.perf_counter()
+
+        # New peer every run, so the answer is not held back by notification timeout of previous run
+        event = EventFactory(group_id, peers=1).message('Кто дежурит', peer_id=FIRST_PEER_ID + os.getpid())
+        response = app.test_client().post('/6_6', data=json.dumps(event))
+        first_request_done = time.perf_counter()
+        assert response.status_code == 200, response.status_code
+
+        bot_registry.get(group_id).wait_startup(60)
+        startup_done = time.perf_counter()
+
+    print(json.dumps(dict(
+        import_seconds=import_done - start,
+        first_request_seconds=first_request_done - start,
+        startup_seconds=startup_done - start
+    )))
+
+
+def run_child(fake_vk, group_id, lazy):  # type: (FakeVkApi, int, bool) -> tuple
+    env = dict(
+        os.environ,
+        WEBHOOK_SECRET=os.environ.get('WEBHOOK_SECRET', 'startup-bench'),
+        VK_API_URL=fake_vk.url,
+        VK_API_TOKEN='startup-bench-token',
+        VK_GROUP_ID='',
+        CONFIRMATION_TOKEN='startup-bench-confirmation',
+        VK_CALLBACK_SECRET=CALLBACK_SECRET,
+        EVENT_WORKERS='0',
+        LAZY_STARTUP='1' if lazy else '0',
+        STARTUP_BENCH_GROUP_ID=str(group_id),
+    )
+    env.pop('VK_TENANTS_FILE', None)
+    env.pop('EVENT_DEDUP_DB', None)
+
+    fake_vk.reset_counters()
+    output = subprocess.run(
+        [sys.executable, '-m', 'benchmarks.startup_bench', '--child'],
+        env=env, check=True, stdout=subprocess.PIPE, encoding='utf-8'
+    ).stdout
+    _, calls = fake_vk.snapshot()
+    return json.loads(output.splitlines()[-1]), calls
+
+
+def remove_scratch_files(group_id):  # type: (int) -> None
+    for pattern in (f'{group_id}.sqlite*', f'{GROUP_IDS_DB}*'):
+        for path in Path('.').glob(pattern):
+            path.unlink()
+
+
+def run(args):
+    fake_vk = FakeVkApi(args.group_id, latency=args.vk_latency).start()
+
+    print(f'VK API latency {args.vk_latency * 1000:g} ms, median of {args.repeat} runs')
+    print(f'{"start-up":<12} {"import":>9} {"1st request":>12} {"background":>11}  VK API calls before exit')
+    for lazy in (False, True):
+        for warm in (False, True):
+            timings = []
+            for _ in range(args.repeat):
+                if not warm:
+                    remove_scratch_files(args.group_id)
+                else:
+                    run_child(fake_vk, args.group_id, lazy)  # Leaves databases for the measured run
+                timing, calls = run_child(fake_vk, args.group_id, lazy)
+                timings.append(timing)
+
+            def median_ms(key):
+                return statistics.median(timing[key] for timing in timings) * 1000
+
+            mode = f'{"lazy" if lazy else "eager"}, {"warm" if warm else "cold"}'
+            print(f'{mode:<12} {median_ms("import_seconds"):>6.1f} ms {median_ms("first_request_seconds"):>9.1f} ms '
+                  f'{median_ms("startup_seconds"):>8.1f} ms  {dict(calls)}')
+
+    fake_vk.stop()
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument('--vk-latency', type=float, default=0.1, help='seconds per VK API request')
+    arg_parser.add_argument('--repeat', type=int, default=3)
+    arg_parser.add_argument('--group-id', type=int, default=987654323, help='group id of scratch database')
+    arg_parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = arg_parser.parse_args()
+
+    if args.child:
+        child()
+        return
+
+    for db_path in (Path(f'{args.group_id}.sqlite'), Path(GROUP_IDS_DB)):
+        if db_path.exists():
+            arg_parser.error(f'{db_path} already exists, remove it or choose another --group-id')
+
+    try:
+        run(args)
+    finally:
+        remove_scratch_files(args.group_id)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,134 @@
+"""
+Storage backends compared: writes per second of the changes Bot makes, and cold start -- opening
+the storage and loading everything Bot reads on start. Journal backend is measured with a long
+journal tail to replay and right after compaction.
+
+    python -m benchmarks.storage_bench [--writes 2000] [--peers 500] [--repeat 5]
+
+Scratch files are created in a temporary directory.
+"""
+
+__author__ = 'kranonetka'
+
+import argparse
+import datetime
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+from VkBot.db import STORAGE_BACKENDS, JournalStorage, open_storage
+
+if False:  # Type hinting
+    from VkBot.db import Storage  # noqa
+    from typing import Callable  # noqa
+
+LEFT_ROOMS = tuple(range(601, 620))
+RIGHT_ROOMS = tuple(range(620, 639))
+TODAY = datetime.date(2026, 1, 1)
+NOW = datetime.datetime(2026, 1, 1, 12, 0)
+
+
+def split_rooms(rooms):
+    return tuple(filter(LEFT_ROOMS.__contains__, rooms)), tuple(filter(RIGHT_ROOMS.__contains__, rooms))
+
+
+def write_ops(storage, peers):  # type: (Storage, int) -> dict
+    """
+    Single-row changes Bot makes, by name. Each takes index of the write
+    """
+    def toggle_room(i):
+        if i % 2:
+            storage.add_rooms((638,))
+        else:
+            storage.remove_rooms((638,))
+
+    return {
+        'set_sync': lambda i: storage.set_sync(TODAY, LEFT_ROOMS[i % len(LEFT_ROOMS)], RIGHT_ROOMS[0]),
+        'add/remove room': toggle_room,
+        'last request': lambda i: storage.save_last_requests(
+            {i % peers: NOW + datetime.timedelta(seconds=i)}, NOW - datetime.timedelta(hours=1)),
+        'setting': lambda i: storage.set_setting('long_poll_ts', str(i)),
+    }
+
+
+def load_all(storage):  # type: (Storage) -> None
+    storage.load_rotation()
+    storage.load_sync_history()
+    storage.load_admins()
+    storage.load_last_requests()
+    storage.get_setting('long_poll_ts')
+
+
+def bench_writes(storage, write, count):  # type: (Storage, Callable[[int], None], int) -> float
+    start = time.perf_counter()
+    for i in range(count):
+        write(i)
+    return count / (time.perf_counter() - start)
+
+
+def bench_cold_start(backend, path, repeat):  # type: (str, str, int) -> float
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        storage = open_storage(backend, path)
+        load_all(storage)
+        timings.append(time.perf_counter() - start)
+        close_keeping_journal(storage)
+    return statistics.median(timings)
+
+
+def close_keeping_journal(storage):  # type: (Storage) -> None
+    if isinstance(storage, JournalStorage):
+        storage.close(compact=False)
+    else:
+        storage.close()
+
+
+def populate(storage, peers, tail):  # type: (Storage, int, int) -> None
+    storage.seed_if_empty(LEFT_ROOMS + RIGHT_ROOMS, 227725150, split_rooms, TODAY)
+    storage.add_admins({admin_id: f'Admin {admin_id}' for admin_id in range(1, 6)})
+    storage.save_last_requests({peer_id: NOW for peer_id in range(peers)}, NOW - datetime.timedelta(hours=1))
+    if isinstance(storage, JournalStorage):
+        storage.compact()
+    for i in range(tail):
+        storage.set_setting('long_poll_ts', str(i))
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument('--writes', type=int, default=2000, help='writes of each kind')
+    arg_parser.add_argument('--peers', type=int, default=500, help='stored notification timeouts')
+    arg_parser.add_argument('--tail', type=int, default=5000, help='journal records replayed on cold start')
+    arg_parser.add_argument('--repeat', type=int, default=5, help='cold starts, median is shown')
+    args = arg_parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        open_storage('sqlite', str(Path(tmp_dir) / 'warm-up')).close()  # SQLAlchemy compiles models once
+
+        print(f'{"writes/s":<16}' + ''.join(f'{backend:>12}' for backend in STORAGE_BACKENDS))
+        results = {}
+        for backend in STORAGE_BACKENDS:
+            storage = open_storage(backend, str(Path(tmp_dir) / f'writes-{backend}'))
+            populate(storage, args.peers, tail=0)
+            for name, write in write_ops(storage, args.peers).items():
+                results[name, backend] = bench_writes(storage, write, args.writes)
+            storage.close()
+        for name in write_ops(None, args.peers):
+            print(f'{name:<16}' + ''.join(f'{results[name, backend]:>12.0f}' for backend in STORAGE_BACKENDS))
+
+        print()
+        print(f'cold start, {args.peers} timeouts stored, median of {args.repeat}')
+        for backend in STORAGE_BACKENDS:
+            tails = (0, args.tail) if backend == 'journal' else (0,)
+            for tail in tails:
+                path = str(Path(tmp_dir) / f'start-{backend}-{tail}')
+                storage = open_storage(backend, path, **(dict(compact_every=tail + 1) if backend == 'journal' else {}))
+                populate(storage, args.peers, tail)
+                close_keeping_journal(storage)
+                label = f'{backend}, {tail} records to replay' if backend == 'journal' else backend
+                print(f'  {label:<36} {bench_cold_start(backend, path, args.repeat) * 1000:8.2f} ms')
+
+
+if __name__ == '__main__':
+    main()
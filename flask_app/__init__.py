@@ -1,22 +1,88 @@
 __author__ = 'kranonetka'
 
+import os
+import threading
 from datetime import timedelta
 
+import requests
 from flask import Flask
 
-from VkBot import Bot, MessageParser
-from flask_app.credentials import VK_API_TOKEN
+from VkBot import Bot, MessageParser, ApiUrlAdapter, VkHttpAdapter, GroupIdCache, RevisionReader, Ticker, metrics
+from VkBot.db import open_storage
+from flask_app.credentials import VK_API_TOKEN, CONFIRMATION_TOKEN, VK_CALLBACK_SECRET, VK_GROUP_ID
+from flask_app.registry import BotRegistry, Tenant, load_tenants, resolve_group_id
 
 app = Flask(__name__)
 app.config['DEBUG'] = True
+app.config['EVENT_WORKERS'] = int(os.environ.get('EVENT_WORKERS', 0))  # 0 -- handle events inside the request
+app.config['EVENT_QUEUE_SIZE'] = int(os.environ.get('EVENT_QUEUE_SIZE', 100))  # Per worker
+app.config['EVENT_DEDUP_TTL'] = float(os.environ.get('EVENT_DEDUP_TTL', 600))  # Seconds
+app.config['EVENT_DEDUP_SIZE'] = int(os.environ.get('EVENT_DEDUP_SIZE', 10000))
+app.config['EVENT_DEDUP_DB'] = os.environ.get('EVENT_DEDUP_DB')  # SQLite file shared between processes
+app.config['VK_API_URL'] = os.environ.get('VK_API_URL')
+app.config['VK_API_POOL_SIZE'] = int(os.environ.get('VK_API_POOL_SIZE', 10))  # Connections shared by all groups
+app.config['VK_TENANTS_FILE'] = os.environ.get('VK_TENANTS_FILE')  # JSON list of served groups
+app.config['ADMINS_SYNC_INTERVAL'] = float(os.environ.get('ADMINS_SYNC_INTERVAL', 5))  # Seconds
+app.config['ROTATION_SYNC_INTERVAL'] = float(os.environ.get('ROTATION_SYNC_INTERVAL', 5))  # Seconds
+app.config['PARSE_CACHE_SIZE'] = int(os.environ.get('PARSE_CACHE_SIZE', 256))
+app.config['METRICS_ENABLED'] = os.environ.get('METRICS_ENABLED', '0') == '1'  # Served on /metrics
+app.config['LAZY_STARTUP'] = os.environ.get('LAZY_STARTUP', '1') == '1'  # No VK API calls before serving
+app.config['STORAGE_BACKEND'] = os.environ.get('STORAGE_BACKEND', 'sqlite')  # 'journal' -- one process only
 
-vk_bot = Bot(
-    access_token=VK_API_TOKEN,
-    left_rooms=tuple(range(601, 620)),
-    right_rooms=tuple(range(620, 639)),
-    today_notification_timeout=timedelta(minutes=10)
-)
+if app.config['METRICS_ENABLED']:
+    metrics.enable()
 
-message_parser = MessageParser()
+
+def create_bot(tenant, http_session, revision, ticker):  # type: (Tenant, requests.Session, RevisionReader, Ticker) -> Bot
+    return Bot(
+        access_token=tenant.access_token,
+        left_rooms=tenant.left_rooms,
+        right_rooms=tenant.right_rooms,
+        today_notification_timeout=timedelta(minutes=10),
+        admins_sync_interval=timedelta(seconds=app.config['ADMINS_SYNC_INTERVAL']),
+        rotation_sync_interval=timedelta(seconds=app.config['ROTATION_SYNC_INTERVAL']),
+        group_id=tenant.group_id,
+        http_session=http_session,
+        revision=revision,
+        ticker=ticker,
+        lazy_startup=app.config['LAZY_STARTUP'],
+        storage_backend=app.config['STORAGE_BACKEND'],
+        floor=tenant.floor
+    )
+
+
+def has_subscriptions(tenant):  # type: (Tenant) -> bool
+    storage = open_storage(app.config['STORAGE_BACKEND'], str(tenant.group_id))
+    try:
+        return bool(storage.load_subscriptions())
+    finally:
+        storage.close()
+
+
+shared_http_session = requests.Session()
+if app.config['VK_API_URL'] is not None:
+    ApiUrlAdapter.mount(shared_http_session, app.config['VK_API_URL'], pool_size=app.config['VK_API_POOL_SIZE'])
+else:
+    VkHttpAdapter.mount(shared_http_session, pool_size=app.config['VK_API_POOL_SIZE'])
+
+if app.config['VK_TENANTS_FILE'] is not None:
+    tenants = load_tenants(app.config['VK_TENANTS_FILE'])
+else:
+    tenants = [
+        Tenant(
+            group_id=int(VK_GROUP_ID) if VK_GROUP_ID else resolve_group_id(
+                VK_API_TOKEN, shared_http_session, GroupIdCache() if app.config['LAZY_STARTUP'] else None),
+            access_token=VK_API_TOKEN,
+            confirmation_token=CONFIRMATION_TOKEN,
+            secret=VK_CALLBACK_SECRET
+        )
+    ]
+
+bot_registry = BotRegistry(tenants, create_bot, shared_http_session)
+# Midnight announcements are sent by bots, so bots with subscribers must not wait for the first event
+threading.Thread(target=bot_registry.preload, args=(has_subscriptions,), name='BotRegistry-preload',
+                 daemon=True).start()
+
+message_parser = MessageParser(cache_size=app.config['PARSE_CACHE_SIZE'])
 
 from flask_app import routes  # noqa: F401,E402
@@ -2,7 +2,10 @@ __author__ = 'kranonetka'
 
 import os
 
-CONFIRMATION_TOKEN = os.environ['CONFIRMATION_TOKEN']
-VK_API_TOKEN = os.environ['VK_API_TOKEN']
-VK_CALLBACK_SECRET = os.environ['VK_CALLBACK_SECRET']
 WEBHOOK_SECRET = os.environ['WEBHOOK_SECRET']
+
+# Single group setup, used when VK_TENANTS_FILE is not given
+CONFIRMATION_TOKEN = os.environ.get('CONFIRMATION_TOKEN')
+VK_API_TOKEN = os.environ.get('VK_API_TOKEN')
+VK_CALLBACK_SECRET = os.environ.get('VK_CALLBACK_SECRET')
+VK_GROUP_ID = os.environ.get('VK_GROUP_ID')
@@ -0,0 +1,79 @@
+__author__ = 'kranonetka'
+
+import threading
+import time
+from collections import OrderedDict
+
+from VkBot.db import sqlite_transaction
+
+if False:  # Type hinting
+    from typing import Optional  # noqa
+
+
+class EventDeduplicator:
+    """
+    Remembers `event_id`s of handled callbacks for `ttl` seconds to skip events re-delivered by VK.
+    In-memory index is bounded by `max_size`, the oldest ids are evicted first.
+    If `db_path` given, ids are kept in SQLite file instead, so several worker processes share them.
+    """
+
+    def __init__(self, ttl, max_size, db_path=None):  # type: (float, int, Optional[str]) -> None
+        self._ttl = ttl
+        self._max_size = max_size
+        self._lock = threading.Lock()
+        self._seen = OrderedDict()  # type: OrderedDict[str, float]  # event_id -> expiration time
+        self._db_path = db_path
+        self._last_purge = 0.0
+
+        if db_path is not None:
+            with sqlite_transaction(self._db_path) as connection:
+                connection.execute(
+                    'CREATE TABLE IF NOT EXISTS SeenEvents (event_id TEXT PRIMARY KEY, expires REAL NOT NULL)'
+                )
+
+    def is_duplicate(self, event_id):  # type: (str) -> bool
+        """
+        Check event id and remember it. True if it was already seen and not expired yet
+        """
+        now = time.monotonic() if self._db_path is None else time.time()
+        with self._lock:
+            if self._db_path is None:
+                return self._check_memory(event_id, now)
+            return self._check_db(event_id, now)
+
+    def forget(self, event_id):  # type: (str) -> None
+        """
+        Drop remembered id, so the event is handled again when VK re-delivers it
+        """
+        with self._lock:
+            if self._db_path is None:
+                self._seen.pop(event_id, None)
+            else:
+                with sqlite_transaction(self._db_path) as connection:
+                    connection.execute('DELETE FROM SeenEvents WHERE event_id = ?', (event_id,))
+
+    def _check_memory(self, event_id, now):  # type: (str, float) -> bool
+        seen = self._seen
+        while seen:
+            oldest_id, expires = next(iter(seen.items()))
+            if expires > now and len(seen) < self._max_size:
+                break
+            del seen[oldest_id]
+
+        if event_id in seen:
+            return True
+        seen[event_id] = now + self._ttl
+        return False
+
+    def _check_db(self, event_id, now):  # type: (str, float) -> bool
+        with sqlite_transaction(self._db_path) as connection:
+            if now - self._last_purge > self._ttl:
+                connection.execute('DELETE FROM SeenEvents WHERE expires <= ?', (now,))
+                self._last_purge = now
+
+            cursor = connection.execute(
+                'INSERT INTO SeenEvents (event_id, expires) VALUES (?, ?) '
+                'ON CONFLICT (event_id) DO UPDATE SET expires = excluded.expires WHERE expires <= ?',
+                (event_id, now + self._ttl, now)
+            )
+            return cursor.rowcount == 0
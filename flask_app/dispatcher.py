@@ -0,0 +1,66 @@
+__author__ = 'kranonetka'
+
+import queue
+import threading
+import traceback
+
+from VkBot import get_peer_id
+
+if False:  # Type hinting
+    from typing import Callable, List  # noqa
+
+
+class EventDispatcher:
+    """
+    Processes callback events on a pool of worker threads so the callback can be acknowledged at once.
+    Events of the same peer always go to the same worker, which keeps their order.
+    Each worker has bounded queue; when it is full the event is dropped instead of blocking the request.
+    """
+
+    def __init__(self, handler, workers, queue_size):  # type: (Callable[[dict], None], int, int) -> None
+        self._handler = handler
+        self._queues = [queue.Queue(maxsize=queue_size) for _ in range(workers)]  # type: List[queue.Queue]
+        self._dropped = 0
+        self._dropped_lock = threading.Lock()
+
+        for idx, events in enumerate(self._queues):
+            threading.Thread(
+                target=self._work,
+                args=(events,),
+                name=f'{self.__class__.__name__}-{idx}',
+                daemon=True
+            ).start()
+
+    @property
+    def dropped(self):  # type: () -> int
+        return self._dropped
+
+    def submit(self, event):  # type: (dict) -> bool
+        """
+        Put event to its peer's worker queue. Returns False if event was shed because the queue is full
+        """
+        events = self._queues[get_peer_id(event) % len(self._queues)]
+        try:
+            events.put_nowait(event)
+        except queue.Full:
+            with self._dropped_lock:
+                self._dropped += 1
+            return False
+        return True
+
+    def join(self):  # type: () -> None
+        """
+        Block until all submitted events are processed
+        """
+        for events in self._queues:
+            events.join()
+
+    def _work(self, events):  # type: (queue.Queue) -> None
+        while True:
+            event = events.get()
+            try:
+                self._handler(event)
+            except Exception:  # noqa
+                traceback.print_exc()
+            finally:
+                events.task_done()
@@ -0,0 +1,140 @@
+__author__ = 'kranonetka'
+
+import json
+import threading
+
+import requests
+import vk_api
+
+from VkBot import RevisionReader, Ticker, VkHttpAdapter
+
+if False:  # Type hinting
+    from VkBot import Bot, GroupIdCache  # noqa
+    from typing import Callable, Dict, Iterable, List, Optional  # noqa
+
+
+class Tenant:
+    """
+    Settings of one VK group served by the app
+    """
+
+    def __init__(self, group_id, access_token, confirmation_token, secret,
+                 left_rooms=tuple(range(601, 620)), right_rooms=tuple(range(620, 639)), floor=6):
+        """
+        :type group_id: int
+        :type access_token: str
+        :type confirmation_token: str
+        :type secret: str
+        :type left_rooms: Tuple[int, ...]
+        :type right_rooms: Tuple[int, ...]
+        :type floor: int
+        """
+        self.group_id = group_id
+        self.access_token = access_token
+        self.confirmation_token = confirmation_token
+        self.secret = secret
+        self.left_rooms = tuple(left_rooms)
+        self.right_rooms = tuple(right_rooms)
+        self.floor = floor
+
+    @classmethod
+    def from_json(cls, obj):  # type: (dict) -> Tenant
+        """
+        Rooms are given as inclusive ranges: "left_rooms": [601, 619]
+        """
+        obj = dict(obj)
+        for side in ('left_rooms', 'right_rooms'):
+            if side in obj:
+                first, last = obj[side]
+                obj[side] = tuple(range(first, last + 1))
+        return cls(**obj)
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}({self.group_id})'
+
+
+def load_tenants(path):  # type: (str) -> List[Tenant]
+    with open(path, 'r', encoding='utf-8') as fp:
+        return [Tenant.from_json(obj) for obj in json.load(fp)]
+
+
+def resolve_group_id(access_token, http_session, cache=None):
+    """
+    :type access_token: str
+    :type http_session: requests.Session
+    :param cache: Optional[GroupIdCache] -- VK API is asked only for tokens missing in it
+    :rtype: int
+    """
+    def fetch():
+        session = vk_api.VkApiGroup(token=access_token, session=http_session)
+        return session.method('groups.getById')[0]['id']
+
+    return cache.resolve(access_token, fetch) if cache is not None else fetch()
+
+
+class BotRegistry:
+    """
+    Bots of all served groups by `group_id`. Bot is created on the first event of its group
+    or by `preload`, all bots share one HTTP session, one git revision reader and one ticker thread
+    for their background jobs.
+    """
+
+    def __init__(self, tenants, bot_factory, http_session=None, revision=None, ticker=None):
+        """
+        :type tenants: Iterable[Tenant]
+        :param bot_factory: Callable[[Tenant, requests.Session, RevisionReader, Ticker], Bot]
+        :param http_session: Optional[requests.Session] -- with VK adapter mounted, own one is created if not given
+        :param revision: Optional[RevisionReader] -- own one is opened if not given
+        :param ticker: Optional[Ticker] -- own one is started if not given
+        """
+        self._tenants = {tenant.group_id: tenant for tenant in tenants}  # type: Dict[int, Tenant]
+        self._bot_factory = bot_factory
+        if http_session is None:
+            http_session = requests.Session()
+            VkHttpAdapter.mount(http_session)
+        self._http_session = http_session
+        self._revision = revision if revision is not None else RevisionReader()
+        self._ticker = ticker if ticker is not None else Ticker()
+        self._bots = {}  # type: Dict[int, Bot]
+        self._locks = {group_id: threading.Lock() for group_id in self._tenants}  # type: Dict[int, threading.Lock]
+
+    @property
+    def http_session(self):  # type: () -> requests.Session
+        return self._http_session
+
+    def tenant(self, group_id):  # type: (int) -> Optional[Tenant]
+        return self._tenants.get(group_id)
+
+    def get(self, group_id):  # type: (int) -> Optional[Bot]
+        bot = self._bots.get(group_id)
+        if bot is not None or group_id not in self._tenants:
+            return bot
+
+        with self._locks[group_id]:
+            bot = self._bots.get(group_id)
+            if bot is None:
+                bot = self._bots[group_id] = self._create_bot(self._tenants[group_id])
+            return bot
+
+    def preload(self, should_load):  # type: (Callable[[Tenant], bool]) -> None
+        """
+        Create bots of tenants accepted by `should_load` without waiting for their events,
+        e.g. ones whose background jobs must run from the start. `should_load` is called under
+        the lock of tenant's group and only for groups without bot, so it may open bot's files
+        """
+        for group_id, tenant in self._tenants.items():
+            with self._locks[group_id]:
+                if group_id not in self._bots and should_load(tenant):
+                    self._bots[group_id] = self._create_bot(tenant)
+
+    def loaded(self):  # type: () -> List[Bot]
+        return list(self._bots.values())
+
+    def __contains__(self, group_id):  # type: (int) -> bool
+        return group_id in self._tenants
+
+    def __len__(self):
+        return len(self._tenants)
+
+    def _create_bot(self, tenant):  # type: (Tenant) -> Bot
+        return self._bot_factory(tenant, self._http_session, self._revision, self._ticker)
@@ -3,18 +3,43 @@ __author__ = 'kranonetka'
 import json
 
 import git
-from flask import request, abort
+from flask import request, abort, Response
 
-from flask_app import app, vk_bot
-from flask_app.credentials import WEBHOOK_SECRET, CONFIRMATION_TOKEN, VK_CALLBACK_SECRET
+from VkBot import metrics
+from flask_app import app, bot_registry
+from flask_app.credentials import WEBHOOK_SECRET
+from flask_app.dedup import EventDeduplicator
+from flask_app.dispatcher import EventDispatcher
 from flask_app.functions import is_valid_signature, handle_event
 
+if app.config['EVENT_WORKERS'] > 0:
+    event_dispatcher = EventDispatcher(
+        handle_event,
+        workers=app.config['EVENT_WORKERS'],
+        queue_size=app.config['EVENT_QUEUE_SIZE']
+    )
+else:
+    event_dispatcher = None
+
+event_deduplicator = EventDeduplicator(
+    ttl=app.config['EVENT_DEDUP_TTL'],
+    max_size=app.config['EVENT_DEDUP_SIZE'],
+    db_path=app.config['EVENT_DEDUP_DB']
+)
+
 
 @app.route('/', methods=['GET'])
 def index():
     return 'Hello, world!'
 
 
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    if not metrics.enabled:
+        abort(404)
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+
 @app.route('/update_app', methods=['POST'])
 def github_webhook():
     if 'X-Hub-Signature' in request.headers:
@@ -53,13 +78,27 @@ def vk_callback():
     if any(key not in event for key in ('type', 'group_id')):
         abort(404)
 
+    tenant = bot_registry.tenant(event['group_id'])
+    if tenant is None:
+        abort(404)
+
     if event['type'] == 'confirmation':
-        if vk_bot.is_bot_id(event['group_id']):
-            return CONFIRMATION_TOKEN
+        return tenant.confirmation_token
 
-    if secret != VK_CALLBACK_SECRET:
+    if secret != tenant.secret:
         abort(401)
 
-    handle_event(event)
+    if 'event_id' in event and event_deduplicator.is_duplicate(event['event_id']):
+        return "ok"
+
+    if event_dispatcher is None:
+        try:
+            handle_event(event)
+        except Exception:
+            if 'event_id' in event:  # Failed with 500, VK will re-deliver it
+                event_deduplicator.forget(event['event_id'])
+            raise
+    elif not event_dispatcher.submit(event):
+        print(f'Event queue is full, dropped {event_dispatcher.dropped} events so far')
 
     return "ok"
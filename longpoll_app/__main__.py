@@ -0,0 +1,59 @@
+"""
+Serves one group through Bots Long Poll API, no public callback endpoint is needed.
+
+    VK_API_TOKEN=... VK_GROUP_ID=... python -m longpoll_app
+
+Processing resumes from the last handled event after restart.
+"""
+
+__author__ = 'kranonetka'
+
+import asyncio
+import os
+import signal
+from datetime import timedelta
+
+from VkBot import Bot, MessageParser, EventHandler, LongPollRunner
+
+
+def create_bot():  # type: () -> Bot
+    group_id = os.environ.get('VK_GROUP_ID')
+    return Bot(
+        access_token=os.environ['VK_API_TOKEN'],
+        today_notification_timeout=timedelta(minutes=10),
+        api_url=os.environ.get('VK_API_URL'),
+        admins_sync_interval=timedelta(seconds=float(os.environ.get('ADMINS_SYNC_INTERVAL', 5))),
+        rotation_sync_interval=timedelta(seconds=float(os.environ.get('ROTATION_SYNC_INTERVAL', 5))),
+        group_id=int(group_id) if group_id else None,
+        lazy_startup=os.environ.get('LAZY_STARTUP', '1') == '1',
+        storage_backend=os.environ.get('STORAGE_BACKEND', 'sqlite')
+    )
+
+
+async def serve(bot, parser):  # type: (Bot, MessageParser) -> None
+    runner = LongPollRunner(
+        bot.create_long_poll(wait=int(os.environ.get('LONG_POLL_WAIT', 25))),
+        EventHandler(lambda group_id: bot if bot.is_bot_id(group_id) else None, parser),
+        concurrency=int(os.environ.get('LONG_POLL_CONCURRENCY', 4)),
+        load_ts=bot.load_long_poll_ts,
+        save_ts=bot.save_long_poll_ts
+    )
+
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, runner.stop)
+
+    await runner.run()
+
+
+def main():
+    bot = create_bot()
+    parser = MessageParser(cache_size=int(os.environ.get('PARSE_CACHE_SIZE', 256)))
+    try:
+        asyncio.run(serve(bot, parser))
+    finally:
+        bot.close()
+
+
+if __name__ == '__main__':
+    main()